@@ -17,4 +17,37 @@ class Config:
     echo_string = environ.get('SQLALCHEMY_ECHO')
     SQLALCHEMY_ECHO = False
     if echo_string.lower().strip() == "true":
-        SQLALCHEMY_ECHO = True
\ No newline at end of file
+        SQLALCHEMY_ECHO = True
+
+    # READ-ONLY COPY - listings are read from here when set, e.g. 'sqlite:///file:library-replica.db?mode=ro&immutable=1&uri=true'
+    SQLALCHEMY_READ_DATABASE_URI = environ.get('SQLALCHEMY_READ_DATABASE_URI')
+    READ_YOUR_WRITES_SECONDS = float(environ.get('READ_YOUR_WRITES_SECONDS', '5'))  # a user's listings stay on the primary this long after their write, < 0: always
+
+    # CONNECTION POOL AND SQLITE PRAGMAS (see library/adapters/database_engine.py)
+    SQLALCHEMY_POOL = environ.get('SQLALCHEMY_POOL', 'queue')  # 'null', 'queue', 'singleton' or 'static'
+    SQLALCHEMY_POOL_SIZE = int(environ.get('SQLALCHEMY_POOL_SIZE', '5'))  # connections kept open by the 'queue' pool
+    SQLALCHEMY_MAX_OVERFLOW = int(environ.get('SQLALCHEMY_MAX_OVERFLOW', '10'))  # extra connections the 'queue' pool opens under load
+    SQLITE_JOURNAL_MODE = environ.get('SQLITE_JOURNAL_MODE', 'WAL')  # empty values leave SQLite's default
+    SQLITE_SYNCHRONOUS = environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+    SQLITE_CACHE_SIZE = environ.get('SQLITE_CACHE_SIZE', '-20000')  # negative: KiB instead of pages
+    SQLITE_MMAP_SIZE = environ.get('SQLITE_MMAP_SIZE', '268435456')
+    SQLITE_TEMP_STORE = environ.get('SQLITE_TEMP_STORE', 'MEMORY')
+
+    # DATA IMPORT
+    DATA_IMPORT_JOBS = int(environ.get('DATA_IMPORT_JOBS', '1'))  # > 1 parses the books file in a process pool
+    MEMORY_SNAPSHOT_PATH = environ.get('MEMORY_SNAPSHOT_PATH')  # populated MemoryRepository is cached here when set
+    BULK_INSERT_BATCH_SIZE = int(environ.get('BULK_INSERT_BATCH_SIZE', '1000'))  # rows per executemany when populating the database
+    DATABASE_POPULATE_MODE = environ.get('DATABASE_POPULATE_MODE', 'rebuild')  # 'rebuild' empties and reloads the tables, 'sync' only applies changes
+    PASSWORD_HASH_CACHE_PATH = environ.get('PASSWORD_HASH_CACHE_PATH')  # hashes of imported user passwords are reused from here when set, as sensitive as users.csv (written 0600)
+
+    # POPULATING ON STARTUP - turn off when the database is built offline with manage.py
+    populate_on_startup_string = environ.get('POPULATE_ON_STARTUP', 'True')
+    POPULATE_ON_STARTUP = True
+    if populate_on_startup_string.lower().strip() == "false":
+        POPULATE_ON_STARTUP = False
+
+    # SHARED CATALOGUE (memory repository only)
+    shared_catalogue_string = environ.get('SHARED_CATALOGUE', 'False')
+    SHARED_CATALOGUE = False
+    if shared_catalogue_string.lower().strip() == "true":
+        SHARED_CATALOGUE = True
\ No newline at end of file
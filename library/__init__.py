@@ -4,13 +4,23 @@ from pathlib import Path
 from library.domain.model import Book
 import library.adapters.repository as repo
 from library.adapters.memory_repository import MemoryRepository 
-from library.adapters import memory_repository, database_repository, repository_populate
-from library.adapters.orm import metadata, map_model_to_tables
+from library.adapters import memory_repository, database_repository, repository_populate, memory_snapshot, data_importer
+from library.adapters.shared_repository import SharedCatalogueRepository
+from library.adapters.orm import map_model_to_tables
+from library.adapters.database_engine import create_database_engine, database_engine_options
 
 # SQLAlchemy imports
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, clear_mappers
-from sqlalchemy.pool import NullPool
+from sqlalchemy.orm import sessionmaker
+
+
+def open_database(database_engine):
+    # workers never run DDL on an existing database, several of them booting at once would race on it
+    missing = repository_populate.schema_changes(database_engine)
+    if missing:
+        raise RuntimeError(f"The database schema is out of date (missing {', '.join(missing)}), "
+                           f"run 'python manage.py migrate' first")
+    map_model_to_tables()
+
 
 def create_app(test_config=None):
     app = Flask(__name__)
@@ -24,35 +34,68 @@ def create_app(test_config=None):
         data_path = app.config['TEST_DATA_PATH']
     
     # POPULATE MEMORY REPO WITH DATA
-    if app.config['REPOSITORY'] == 'memory':
-        repo.repo_instance = MemoryRepository()
-        database_mode = False
-        repository_populate.populate(data_path, repo.repo_instance, database_mode)
+    if app.config['REPOSITORY'] == 'memory' and app.config['SHARED_CATALOGUE']:
+        # books are held in one read-only catalogue shared by forked workers, each worker only owns its overlay
+        catalogue = data_importer.load_catalogue(data_path, app.config['DATA_IMPORT_JOBS'])
+        repo.repo_instance = SharedCatalogueRepository(catalogue)
+        data_importer.load_users(data_path, repo.repo_instance, app.config['DATA_IMPORT_JOBS'],
+                                 app.config['PASSWORD_HASH_CACHE_PATH'])
+
+    elif app.config['REPOSITORY'] == 'memory':
+        snapshot_path = app.config['MEMORY_SNAPSHOT_PATH']
+        repo.repo_instance = None
+        if snapshot_path:
+            repo.repo_instance = memory_snapshot.load_snapshot(snapshot_path, data_path)
+
+        if repo.repo_instance is None:
+            repo.repo_instance = MemoryRepository()
+            database_mode = False
+            repository_populate.populate(data_path, repo.repo_instance, database_mode, app.config['DATA_IMPORT_JOBS'],
+                                         password_hash_cache=app.config['PASSWORD_HASH_CACHE_PATH'])
+            if snapshot_path:
+                memory_snapshot.write_snapshot(repo.repo_instance, snapshot_path, data_path)
 
     elif app.config['REPOSITORY'] == 'database':
-        database_uri = app.config['SQLALCHEMY_DATABASE_URI']
-        database_echo = app.config['SQLALCHEMY_ECHO']
-        database_engine = create_engine(database_uri, connect_args={"check_same_thread": False}, poolclass=NullPool, echo=database_echo)
+        database_engine = create_database_engine(app.config['SQLALCHEMY_DATABASE_URI'], app.config['SQLALCHEMY_ECHO'],
+                                                 **database_engine_options(app.config))
         session_factory = sessionmaker(autocommit=False, autoflush=True, bind=database_engine)
-        repo.repo_instance = database_repository.SqlAlchemyRepository(session_factory)
-
-        if app.config['TESTING'] == 'True' or len(database_engine.table_names()) == 0:
+        read_session_factory = None
+        if app.config['SQLALCHEMY_READ_DATABASE_URI']:
+            read_database_engine = create_database_engine(app.config['SQLALCHEMY_READ_DATABASE_URI'], app.config['SQLALCHEMY_ECHO'],
+                                                          **database_engine_options(app.config))
+            read_session_factory = sessionmaker(autocommit=False, autoflush=False, bind=read_database_engine)
+        repo.repo_instance = database_repository.SqlAlchemyRepository(session_factory, read_session_factory,
+                                                                      app.config['READ_YOUR_WRITES_SECONDS'])
+
+        if not app.config['POPULATE_ON_STARTUP']:
+            # the database is built offline with manage.py, workers only open it
+            open_database(database_engine)
+
+        elif app.config['DATABASE_POPULATE_MODE'] == 'sync' and len(database_engine.table_names()) > 0:
+            print("SYNCING DATABASE...")
+
+            # tables added since the database was created
+            repository_populate.prepare_database(database_engine, empty_tables=False)
+            summary = data_importer.sync_database(data_path, repo.repo_instance, app.config['DATA_IMPORT_JOBS'],
+                                                  app.config['BULK_INSERT_BATCH_SIZE'], app.config['PASSWORD_HASH_CACHE_PATH'])
+            for entity, changes in summary.items():
+                print(f"  {entity}: " + ", ".join(f"{count} {change}" for change, count in changes.items()))
+            print("SYNCING DATABASE... FINISHED")
+
+        elif app.config['TESTING'] == 'True' or len(database_engine.table_names()) == 0:
             print("REPOPULATING DATABASE...")
 
-            clear_mappers()
-            # create database tables with conditions
-            metadata.create_all(database_engine)
-            # empty tables
-            for table in reversed(metadata.sorted_tables): 
-                database_engine.execute(table.delete())
-
-            map_model_to_tables()
+            repository_populate.prepare_database(database_engine, empty_tables=True)
             database_mode = True
-            repository_populate.populate(data_path, repo.repo_instance, database_mode)
+            repository_populate.populate(data_path, repo.repo_instance, database_mode, app.config['DATA_IMPORT_JOBS'],
+                                         app.config['BULK_INSERT_BATCH_SIZE'], app.config['PASSWORD_HASH_CACHE_PATH'])
             print("REPOPULATING DATABASE... FINISHED")
         
         else:
-            map_model_to_tables()
+            open_database(database_engine)
+
+        # the import ran outside any request, don't leave its session to the first one
+        repo.repo_instance.close_session()
 
 
     # BLUEPRINTS
@@ -73,11 +116,8 @@ def create_app(test_config=None):
         app.register_blueprint(account.account_blueprint)
 
         
-        @app.before_request
-        def before_flask_http_request_function():
-            if isinstance(repo.repo_instance, database_repository.SqlAlchemyRepository):
-                repo.repo_instance.reset_session()
-
+        # sessions are opened by the first repository call of a request, requests that never reach the
+        # repository (static files, cached pages) don't create one
         @app.teardown_appcontext
         def shutdown_session(exception=None):
             if isinstance(repo.repo_instance, database_repository.SqlAlchemyRepository):
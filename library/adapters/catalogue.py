@@ -0,0 +1,251 @@
+from array import array
+from bisect import bisect_left
+from typing import Iterable, List
+
+from library.domain.model import Publisher, Author, Book, RatingAggregate
+
+
+class StringArena:
+    """ Packs many strings into a single bytes object, so they cost one object instead of one per string """
+
+    def __init__(self, strings: Iterable[str]):
+        offsets = array('q', [0])
+        encoded_strings = []
+        position = 0
+        for string in strings:
+            encoded = string.encode('utf-8')
+            encoded_strings.append(encoded)
+            position += len(encoded)
+            offsets.append(position)
+        self.__data = b''.join(encoded_strings)
+        self.__offsets = offsets
+
+    def __getitem__(self, index: int) -> str:
+        return self.__data[self.__offsets[index]:self.__offsets[index + 1]].decode('utf-8')
+
+    def __len__(self):
+        return len(self.__offsets) - 1
+
+
+class RatingColumns:
+    """ The seeded rating aggregates of books or authors, one array per figure """
+
+    def __init__(self):
+        self.__counts = array('q')
+        self.__totals = array('d')
+        self.__text_reviews_counts = array('q')
+
+    def append(self, entity: RatingAggregate):
+        self.__counts.append(entity.ratings_count)
+        self.__totals.append(entity.ratings_total)
+        self.__text_reviews_counts.append(entity.text_reviews_count)
+
+    def seed(self, entity: RatingAggregate, position: int):
+        count = self.__counts[position]
+        average_rating = self.__totals[position] / count if count > 0 else 0.0
+        entity.seed_ratings(average_rating, count, self.__text_reviews_counts[position])
+
+
+class FrozenCatalogue:
+    """ Read-only, array backed copy of the book catalogue.
+
+        Built once in the master process before the WSGI workers fork. Every column is a handful of
+        large arrays/bytes objects, so reading it from a worker doesn't touch reference counts spread
+        over millions of small objects and the pages stay shared between workers.
+    """
+
+    NONE = -1 # stands in for None in the integer columns
+
+    def __init__(self, books: Iterable[Book]):
+        books = sorted(books)
+
+        author_positions = {}
+        author_ids = array('q')
+        author_names = []
+        author_ratings = RatingColumns()
+        publisher_positions = {}
+        publisher_names = []
+
+        self.__book_ids = array('q')
+        self.__release_years = array('l')
+        self.__num_pages = array('l')
+        self.__ebooks = array('b')
+        self.__publishers = array('l')
+        self.__author_offsets = array('q', [0])
+        self.__authors = array('l')
+        self.__ratings = RatingColumns()
+
+        for book in books:
+            self.__book_ids.append(book.book_id)
+            self.__release_years.append(self.__to_column(book.release_year))
+            self.__num_pages.append(self.__to_column(book.num_pages))
+            self.__ebooks.append(self.__to_column(book.ebook))
+            self.__ratings.append(book)
+
+            publisher_name = book.publisher.name if book.publisher is not None else Publisher(None).name
+            if publisher_name not in publisher_positions:
+                publisher_positions[publisher_name] = len(publisher_names)
+                publisher_names.append(publisher_name)
+            self.__publishers.append(publisher_positions[publisher_name])
+
+            for author in book.authors:
+                if author.unique_id not in author_positions:
+                    author_positions[author.unique_id] = len(author_ids)
+                    author_ids.append(author.unique_id)
+                    author_names.append(author.full_name)
+                    author_ratings.append(author)
+                self.__authors.append(author_positions[author.unique_id])
+            self.__author_offsets.append(len(self.__authors))
+
+        self.__titles = StringArena(book.title for book in books)
+        self.__descriptions = StringArena(book.description or '' for book in books)
+        self.__publisher_names = StringArena(publisher_names)
+        self.__author_ids = author_ids
+        self.__author_names = StringArena(author_names)
+        self.__author_ratings = author_ratings
+
+        # BROWSE ORDERINGS - positions sorted once, ties keep catalogue (book id / first seen) order like the
+        # MemoryRepository orderings do. The books of an author or publisher are kept in book id order.
+        self.__by_title = array('l', sorted(range(len(books)), key=lambda position: books[position].title))
+        self.__by_year = array('l', sorted((position for position in range(len(books))
+                                            if self.__release_years[position] != self.NONE),
+                                           key=lambda position: -self.__release_years[position]))
+        self.__authors_by_name = array('l', sorted(range(len(author_ids)), key=lambda position: author_names[position]))
+        unnamed_publisher = publisher_positions.get(Publisher(None).name)
+        self.__publishers_by_name = array('l', sorted(
+            (position for position in range(len(publisher_names)) if position != unnamed_publisher),
+            key=lambda position: publisher_names[position]))
+        self.__books_of_author = self.__books_of(len(author_ids), (
+            (author_position, position) for position in range(len(books))
+            for author_position in self.author_positions_of_book(position)))
+        self.__books_of_publisher = self.__books_of(len(publisher_names), (
+            (self.__publishers[position], position) for position in range(len(books))))
+
+    @staticmethod
+    def __books_of(number_of_owners: int, links):
+        """ (offsets, book positions) of every owner's books, links being (owner, book position) in book order """
+        books_by_owner = [[] for _ in range(number_of_owners)]
+        for owner, position in links:
+            books_by_owner[owner].append(position)
+        offsets, book_positions = array('q', [0]), array('l')
+        for owner_books in books_by_owner:
+            book_positions.extend(owner_books)
+            offsets.append(len(book_positions))
+        return offsets, book_positions
+
+    @classmethod
+    def __to_column(cls, value) -> int:
+        return cls.NONE if value is None else int(value)
+
+    def __len__(self):
+        return len(self.__book_ids)
+
+    @property
+    def number_of_authors(self) -> int:
+        return len(self.__author_ids)
+
+    @property
+    def number_of_publishers(self) -> int:
+        return len(self.__publisher_names)
+
+    def find_book(self, book_id: int):
+        """ Returns the position of a book in the catalogue, or None """
+        position = bisect_left(self.__book_ids, book_id)
+        if position < len(self.__book_ids) and self.__book_ids[position] == book_id:
+            return position
+        return None
+
+    def book_id_at(self, position: int) -> int:
+        return self.__book_ids[position]
+
+    def author_positions_of_book(self, position: int) -> List[int]:
+        return list(self.__authors[self.__author_offsets[position]:self.__author_offsets[position + 1]])
+
+    def publisher_position_of_book(self, position: int) -> int:
+        return self.__publishers[position]
+
+    # BROWSING - answered from the orderings without materializing anything
+    @staticmethod
+    def __equal_range(ordering: array, key_of, key):
+        """ [start, end) of the positions in ordering whose key_of(position) equals key """
+        low, high = 0, len(ordering)
+        while low < high:
+            middle = (low + high) // 2
+            if key_of(ordering[middle]) < key:
+                low = middle + 1
+            else:
+                high = middle
+        end = low
+        while end < len(ordering) and key_of(ordering[end]) == key:
+            end += 1
+        return low, end
+
+    @staticmethod
+    def __distinct(ordering: array, key_of) -> list:
+        keys = []
+        for position in ordering:
+            key = key_of(position)
+            if key not in keys[-1:]:
+                keys.append(key)
+        return keys
+
+    def __owned_books(self, books_of_owner, owner: int) -> List[int]:
+        offsets, book_positions = books_of_owner
+        return list(book_positions[offsets[owner]:offsets[owner + 1]])
+
+    def titles(self) -> List[str]:
+        return self.__distinct(self.__by_title, self.__titles.__getitem__)
+
+    def positions_with_title(self, title: str) -> List[int]:
+        start, end = self.__equal_range(self.__by_title, self.__titles.__getitem__, title)
+        return list(self.__by_title[start:end])
+
+    def release_years(self) -> List[int]:
+        """ Newest first """
+        return self.__distinct(self.__by_year, self.__release_years.__getitem__)
+
+    def positions_for_year(self, release_year: int) -> List[int]:
+        start, end = self.__equal_range(self.__by_year, lambda position: -self.__release_years[position], -release_year)
+        return list(self.__by_year[start:end])
+
+    def author_names(self) -> List[str]:
+        return self.__distinct(self.__authors_by_name, self.__author_names.__getitem__)
+
+    def positions_for_author_name(self, author_name: str) -> List[int]:
+        # the books of the first author with the name, the one MemoryRepository.get_author_by_name finds
+        start, end = self.__equal_range(self.__authors_by_name, self.__author_names.__getitem__, author_name)
+        if start == end:
+            return []
+        return self.__owned_books(self.__books_of_author, self.__authors_by_name[start])
+
+    def publisher_names(self) -> List[str]:
+        """ Without the "N/A" stand-in, it isn't a publisher the browse pages list """
+        return self.__distinct(self.__publishers_by_name, self.__publisher_names.__getitem__)
+
+    def positions_for_publisher_name(self, publisher_name: str) -> List[int]:
+        start, end = self.__equal_range(self.__publishers_by_name, self.__publisher_names.__getitem__, publisher_name)
+        if start == end:
+            return []
+        return self.__owned_books(self.__books_of_publisher, self.__publishers_by_name[start])
+
+    # MATERIALIZING OBJECTS
+    def make_author(self, author_position: int) -> Author:
+        author = Author(self.__author_ids[author_position], self.__author_names[author_position])
+        self.__author_ratings.seed(author, author_position)
+        return author
+
+    def make_publisher(self, publisher_position: int) -> Publisher:
+        return Publisher(self.__publisher_names[publisher_position])
+
+    def make_book(self, position: int) -> Book:
+        """ Builds a Book without authors or publisher, those are shared objects the caller links in """
+        book = Book(self.__book_ids[position], self.__titles[position])
+        book.description = self.__descriptions[position]
+        if self.__release_years[position] != self.NONE:
+            book.release_year = self.__release_years[position]
+        if self.__num_pages[position] != self.NONE:
+            book.num_pages = self.__num_pages[position]
+        if self.__ebooks[position] != self.NONE:
+            book.ebook = bool(self.__ebooks[position])
+        self.__ratings.seed(book, position)
+        return book
@@ -2,110 +2,134 @@ import csv
 from pathlib import Path
 from datetime import date, datetime, time
 
-from werkzeug.security import generate_password_hash
-
-from library.adapters.repository import AbstractRepository
+from library.adapters.repository import AbstractRepository, BULK_INSERT_BATCH_SIZE
 from library.domain.model import User, Review, Book, Author, Publisher, make_review
 from library.adapters.jsondatareader import BooksJSONReader
+from library.adapters.catalogue import FrozenCatalogue
+from library.adapters import password_hashes
+
+
+def load_books_and_authors(data_path: Path, repo: AbstractRepository, database_mode: bool, jobs: int = 1,
+                           batch_size: int = BULK_INSERT_BATCH_SIZE, password_hash_cache=None):
+    if database_mode == True:
+        # Loading new objects into the repo, in one transaction
+        repo.bulk_load(batch_size=batch_size, **build_database_objects(data_path, jobs, password_hash_cache))
+
+    else:
+        authors = str(data_path / 'book_authors_excerpt.json')
+        books = str(data_path / 'comic_books_excerpt.json')
+        reader = BooksJSONReader(books, authors)
+        # books are streamed from the file, so only the repository holds the full catalogue
+        for book in reader.iter_books(jobs):
+            repo.add_book(book)
+            for author in book.authors:
+                if repo.get_author(author.unique_id) is None:
+                    repo.add_author(author)
+            if book.publisher.name != "N/A":
+                repo.add_publisher(book.publisher)
+            repo.create_review(book)
 
 
-def load_books_and_authors(data_path: Path, repo: AbstractRepository, database_mode: bool):
+def build_database_objects(data_path: Path, jobs: int = 1, password_hash_cache=None) -> dict:
+    """ Reads the source files into fresh, fully linked objects for the database:
+        {'users': [...], 'authors': [...], 'publishers': [...], 'books': [...], 'reviews': [...]} """
     authors = str(data_path / 'book_authors_excerpt.json')
     books = str(data_path / 'comic_books_excerpt.json')
     reader = BooksJSONReader(books, authors)
-    reader.read_json_files()
-   
-    if database_mode == True:
-        list_of_authors = []
-        list_of_publishers = []
-        list_of_books = []
-        list_of_reviews = []
-        # Create new objects, based on JSON book objects
-        for book in reader.dataset_of_books:
-            # AUTHORS
-            for author in book.authors:
+
+    # users are inserted together with everything else, so reviews are linked to the CSV's User objects
+    users = {user.user_name: user for user in read_users(data_path, jobs, password_hash_cache)}
+    # identity maps, so every lookup while building the object graph is O(1)
+    authors_by_id = {}          # author_id -> Author
+    publishers_by_name = {}     # name -> Publisher
+    books_by_id = {}            # book_id -> Book
+    list_of_reviews = []
+    review_keys = set()         # (book_id, review_text, rating, timestamp) of the reviews already loaded
+
+    # Create new objects, based on JSON book objects
+    for book in reader.iter_books(jobs):
+        if book.book_id in books_by_id:
+            continue
+
+        # AUTHORS
+        for author in book.authors:
+            if author.unique_id not in authors_by_id:
                 new_author = Author(
                     author.unique_id, 
                     author.full_name
                 )
-                if new_author not in list_of_authors:
-                    list_of_authors.append(new_author)
-
-            # PUBLISHERS
-            if book.publisher not in list_of_publishers:
-                list_of_publishers.append(book.publisher)
-
-            # BOOKS
-            new_book = Book(
-                book.book_id, 
-                book.title
-            )
-            new_book.description = book.description
-            new_book.num_pages = book.num_pages
-            if book.release_year is not None:
-                new_book.release_year = book.release_year
-
-            # Connect book with newly created Publisher objects
-            for publisher in list_of_publishers:
-                if book.publisher.name == publisher.name:
-                    new_book.publisher = publisher
-
-            # Connect book to newly created Authors objects
-            for new_author in list_of_authors:
-                for author in book.authors:
-                    if author.unique_id == new_author.unique_id:
-                        new_book.add_author(new_author)            
-            
-            list_of_books.append(new_book)
+                new_author.seed_ratings(author.average_rating, author.ratings_count, author.text_reviews_count)
+                authors_by_id[author.unique_id] = new_author
 
-        
-        # load reviews
-        reviews_filename = str(Path(data_path) / "reviews.csv")
-        for data_row in read_csv_file(reviews_filename):
-
-            book_id = int(data_row[1])
-            book = [book for book in list_of_books if book.book_id == book_id][0]
-
-            user_name = data_row[0]
-            user = repo.get_user(user_name)
-            
-            review = Review(
-                book = book, 
-                review_text = data_row[2], 
-                rating = int(data_row[3]), 
-                user = user, 
-                timestamp = datetime.fromisoformat(data_row[4])
-            )
-
-            if review not in list_of_reviews:
-                list_of_reviews.append(review)
-        
-        # Loading new objects into the repo
-        for book in list_of_books:
-            repo.add_book(book)
+        # PUBLISHERS
+        if book.publisher.name not in publishers_by_name:
+            publishers_by_name[book.publisher.name] = book.publisher
 
-        for author in list_of_authors:
-            repo.add_author(author)
+        # BOOKS
+        new_book = Book(
+            book.book_id, 
+            book.title
+        )
+        new_book.description = book.description
+        new_book.seed_ratings(book.average_rating, book.ratings_count, book.text_reviews_count)
+        new_book.num_pages = book.num_pages
+        if book.release_year is not None:
+            new_book.release_year = book.release_year
+
+        # Connect book with the shared Publisher and Author objects
+        new_book.publisher = publishers_by_name[book.publisher.name]
+        for author in book.authors:
+            new_book.add_author(authors_by_id[author.unique_id])
+
+        books_by_id[new_book.book_id] = new_book
+
+    
+    # load reviews
+    reviews_filename = str(Path(data_path) / "reviews.csv")
+    for data_row in read_csv_file(reviews_filename):
 
-        for publisher in list_of_publishers:
-            repo.add_publisher(publisher)
+        book_id = int(data_row[1])
+        book = books_by_id[book_id]
 
+        user_name = data_row[0]
+        user = users.get(user_name)
         
-        for review in list_of_reviews:
-            try:
-                repo.add_review(review)
-            except:
-                pass
+        review = Review(
+            book = book, 
+            review_text = data_row[2], 
+            rating = int(data_row[3]), 
+            user = user, 
+            timestamp = datetime.fromisoformat(data_row[4])
+        )
 
-    else:
-        for book in reader.dataset_of_books:
-            repo.add_book(book)
+        review_key = (book_id, review.review_text, review.rating, review.timestamp)
+        if review_key not in review_keys:
+            review_keys.add(review_key)
+            list_of_reviews.append(review)
+            book.add_rating(review.rating)
             for author in book.authors:
-                if author not in repo.get_authors():
-                    repo.add_author(author)
-            if book.publisher.name != "N/A":
-                repo.add_publisher(book.publisher)
-            repo.create_review(book)
+                author.add_rating(review.rating)
+
+    return {
+        'users': list(users.values()),
+        'authors': list(authors_by_id.values()),
+        'publishers': list(publishers_by_name.values()),
+        'books': list(books_by_id.values()),
+        'reviews': list_of_reviews
+    }
+
+
+def sync_database(data_path: Path, repo: AbstractRepository, jobs: int = 1,
+                  batch_size: int = BULK_INSERT_BATCH_SIZE, password_hash_cache=None) -> dict:
+    """ Brings an already populated database in line with the source files, see SqlAlchemyRepository.sync """
+    return repo.sync(batch_size=batch_size, **build_database_objects(data_path, jobs, password_hash_cache))
+
+
+def load_catalogue(data_path: Path, jobs: int = 1) -> FrozenCatalogue:
+    authors = str(data_path / 'book_authors_excerpt.json')
+    books = str(data_path / 'comic_books_excerpt.json')
+    reader = BooksJSONReader(books, authors)
+    return FrozenCatalogue(reader.iter_books(jobs))
 
 
 def read_csv_file(filename: str):
@@ -117,14 +141,38 @@ def read_csv_file(filename: str):
             yield row
 
 
-def load_users(data_path: Path, repo: AbstractRepository):
-    users = list()
+def read_users(data_path: Path, jobs: int = 1, password_hash_cache=None):
+    """ Reads users.csv, hashing the plaintext passwords in a process pool when jobs > 1.
+
+        Password columns that already hold a werkzeug hash are used as they are. With a password_hash_cache
+        path, hashes of unchanged passwords are reused from the previous import and the cache is updated.
+    """
     users_filename = str(Path(data_path) / "users.csv")
-    for data_row in read_csv_file(users_filename):
-        user = User (
-            user_name = data_row[1],
-            password = generate_password_hash(data_row[2]) 
-        )
+    rows = [(data_row[1], data_row[2]) for data_row in read_csv_file(users_filename)]
+
+    cache = password_hashes.load_hash_cache(password_hash_cache)
+    hashes = dict()                 # user_name -> password hash
+    plaintexts = dict()             # user_name -> password, for the ones that still need hashing
+    for user_name, password in rows:
+        if password_hashes.is_password_hash(password):
+            hashes[user_name] = password
+        else:
+            hashes[user_name] = password_hashes.cached_hash(cache, user_name, password)
+            if hashes[user_name] is None:
+                plaintexts[user_name] = password
+
+    new_hashes = password_hashes.hash_passwords(list(plaintexts.values()), jobs)
+    for user_name, password_hash in zip(plaintexts.keys(), new_hashes):
+        hashes[user_name] = password_hash
+        cache[user_name] = password_hashes.cache_entry(plaintexts[user_name], password_hash)
+    if password_hash_cache and plaintexts:
+        password_hashes.write_hash_cache(password_hash_cache, cache)
+
+    return [User(user_name=user_name, password=hashes[user_name]) for user_name, password in rows]
+
+
+def load_users(data_path: Path, repo: AbstractRepository, jobs: int = 1, password_hash_cache=None):
+    for user in read_users(data_path, jobs, password_hash_cache):
         repo.add_user(user)
         
 
@@ -0,0 +1,69 @@
+import os
+
+from sqlalchemy import create_engine, event, exc
+from sqlalchemy.pool import NullPool, QueuePool, SingletonThreadPool, StaticPool
+
+
+POOL_CLASSES = {
+    'null': NullPool,                   # a new connection for every session
+    'queue': QueuePool,                 # pool_size connections kept open and shared between threads
+    'singleton': SingletonThreadPool,   # one connection per thread
+    'static': StaticPool                # one connection for everything, e.g. an in-memory database
+}
+
+# config key -> pragma, set on every new SQLite connection; empty values leave SQLite's default
+SQLITE_PRAGMAS = {
+    'SQLITE_JOURNAL_MODE': 'journal_mode',  # WAL: readers don't wait for a writer
+    'SQLITE_SYNCHRONOUS': 'synchronous',    # NORMAL is safe with WAL and skips an fsync per commit
+    'SQLITE_CACHE_SIZE': 'cache_size',      # pages, or KiB when negative
+    'SQLITE_MMAP_SIZE': 'mmap_size',        # bytes of the database file read through memory mapping
+    'SQLITE_TEMP_STORE': 'temp_store'       # MEMORY keeps temporary b-trees (ORDER BY, DISTINCT) off disk
+}
+
+
+def database_engine_options(config) -> dict:
+    """ The create_database_engine arguments found in a config mapping (app.config or vars(Config)) """
+    return {
+        'pool': config.get('SQLALCHEMY_POOL') or 'null',
+        'pool_size': config.get('SQLALCHEMY_POOL_SIZE'),
+        'max_overflow': config.get('SQLALCHEMY_MAX_OVERFLOW'),
+        'sqlite_pragmas': {pragma: config.get(key) for key, pragma in SQLITE_PRAGMAS.items()}
+    }
+
+
+def create_database_engine(database_uri: str, database_echo: bool = False, pool: str = 'null', pool_size: int = None,
+                           max_overflow: int = None, sqlite_pragmas: dict = None):
+    engine_arguments = {'poolclass': POOL_CLASSES[pool], 'echo': database_echo}
+    if pool == 'queue':
+        if pool_size is not None:
+            engine_arguments['pool_size'] = pool_size
+        if max_overflow is not None:
+            engine_arguments['max_overflow'] = max_overflow
+    database_engine = create_engine(database_uri, connect_args={"check_same_thread": False}, **engine_arguments)
+
+    if pool != 'static':
+        # a worker forked after the engine was used (gunicorn --preload) inherits the parent's pooled connections;
+        # it leaves them to the parent and opens its own. A static pool is kept, its one connection is the database
+        # when that is in memory.
+        @event.listens_for(database_engine, 'connect')
+        def remember_process(dbapi_connection, connection_record):
+            connection_record.info['pid'] = os.getpid()
+
+        @event.listens_for(database_engine, 'checkout')
+        def reconnect_after_fork(dbapi_connection, connection_record, connection_proxy):
+            if connection_record.info['pid'] != os.getpid():
+                # dropped without being closed, closing it here would close it for the parent too
+                connection_record.connection = connection_proxy.connection = None
+                raise exc.DisconnectionError(f"Connection opened by process {connection_record.info['pid']}, "
+                                             f"not {os.getpid()}")
+
+    pragmas = [(pragma, value) for pragma, value in (sqlite_pragmas or {}).items() if value not in (None, '')]
+    if database_engine.dialect.name == 'sqlite' and pragmas:
+        @event.listens_for(database_engine, 'connect')
+        def set_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for pragma, value in pragmas:
+                cursor.execute(f"PRAGMA {pragma} = {value}")
+            cursor.close()
+
+    return database_engine
@@ -1,18 +1,30 @@
+import time
+import hashlib
 from typing import List
-from flask import _app_ctx_stack
-from sqlalchemy import desc, asc
+from flask import _app_ctx_stack, has_request_context, session as user_session
+from sqlalchemy import desc, asc, func, select
 from sqlalchemy.orm import scoped_session
 from sqlalchemy.orm.exc import NoResultFound, MultipleResultsFound
 from sqlalchemy.sql.expression import asc, text
 
-from library.adapters.repository import AbstractRepository
+from library.adapters.repository import AbstractRepository, RepositoryException, BrowsePage, NavigationIndex, BULK_INSERT_BATCH_SIZE
+from library.adapters.orm import (
+    users_table, publishers_table, books_table, authors_table, reviews_table, book_authors, user_reading_lists,
+    loader_options
+)
 from library.domain.model import User, Book, Author, Publisher, Review
 
 
+# key of the user's Flask session holding the time.time() of their last write, see SqlAlchemyRepository._read_session
+LAST_WRITE_SESSION_KEY = 'last_database_write'
+
+
 class SessionContextManager:
     def __init__(self, session_factory):
         self.__session_factory = session_factory
+        # one registry for the lifetime of the repository, a Session is only created on first use in a scope
         self.__session = scoped_session(self.__session_factory, scopefunc=_app_ctx_stack.__ident_func__)
+        self.__last_commit = None  # time.time() of the last commit through this manager
 
     def __enter__(self):
         return self
@@ -24,31 +36,312 @@ class SessionContextManager:
     def session(self):
         return self.__session
 
+    @property
+    def last_commit(self):
+        return self.__last_commit
+
     def commit(self):
         self.__session.commit()
+        self.__last_commit = time.time()
+        if has_request_context():
+            # the user's cookie carries it to whichever worker serves their next request
+            user_session[LAST_WRITE_SESSION_KEY] = self.__last_commit
 
     def rollback(self):
         self.__session.rollback()
 
+    @property
+    def session_is_open(self) -> bool:
+        return self.__session.registry.has()
+
     def reset_session(self):
+        # the next repository call in this scope opens a fresh session
         self.close_current_session()
-        self.__session = scoped_session(self.__session_factory, scopefunc=_app_ctx_stack.__ident_func__)
 
     def close_current_session(self):
-        if self.__session is not None:
-            self.__session.close()
+        # only a session that was actually opened in this scope is torn down
+        if self.__session.registry.has():
+            self.__session.remove()
 
 
 class SqlAlchemyRepository(AbstractRepository):
     # SESSION MANAGEMENT
-    def __init__(self, session_factory):
+    def __init__(self, session_factory, read_session_factory=None, read_your_writes_seconds: float = 0):
         self._session_cm = SessionContextManager(session_factory)
+        # listings can be served from a read-only copy of the database, writes and targeted lookups use the primary
+        self._read_session_cm = SessionContextManager(read_session_factory) if read_session_factory is not None else None
+        self.__read_your_writes_seconds = read_your_writes_seconds
 
     def close_session(self):
         self._session_cm.close_current_session()
+        if self._read_session_cm is not None:
+            self._read_session_cm.close_current_session()
 
     def reset_session(self):
         self._session_cm.reset_session()
+        if self._read_session_cm is not None:
+            self._read_session_cm.reset_session()
+
+    @property
+    def _last_write(self):
+        """ time.time() of the last write the listings have to show. During a request that is the current user's
+            last write, kept in their Flask session because the request after it may go to another worker; outside
+            requests (scripts, imports) it is this repository's last commit. """
+        if has_request_context():
+            return user_session.get(LAST_WRITE_SESSION_KEY)
+        return self._session_cm.last_commit
+
+    @property
+    def _read_session(self):
+        """ Session for listing queries. Listings stay on the primary for read_your_writes_seconds after a write
+            (forever when negative, e.g. for an immutable snapshot copy), so a user sees their own review or reading
+            list change even if the read-only copy hasn't caught up. """
+        if self._read_session_cm is None:
+            return self._session_cm.session
+        last_write = self._last_write
+        if last_write is not None and (self.__read_your_writes_seconds < 0 or
+                                       time.time() - last_write < self.__read_your_writes_seconds):
+            return self._session_cm.session
+        return self._read_session_cm.session
+
+    # BULK LOADING
+    def bulk_load(self, users=(), authors=(), publishers=(), books=(), reviews=(), batch_size: int = BULK_INSERT_BATCH_SIZE):
+        """ Inserts every entity type with Core executemany statements inside one transaction,
+            instead of a session add and commit per object. Ids of new users and publishers are
+            assigned here so books and reviews can reference them without a round trip. """
+        session = self._session_cm.session
+
+        user_ids = {user_name: id for id, user_name in session.execute(select([users_table.c.id, users_table.c.user_name]))}
+        next_user_id = max(user_ids.values(), default=0) + 1
+        user_rows = []
+        for user in users:
+            user_ids[user.user_name] = next_user_id
+            user_rows.append({'id': next_user_id, 'user_name': user.user_name, 'password': user.password})
+            next_user_id += 1
+
+        publisher_ids = {name: id for id, name in session.execute(select([publishers_table.c.id, publishers_table.c.name]))}
+        next_publisher_id = max(publisher_ids.values(), default=0) + 1
+        publisher_rows = []
+        for publisher in publishers:
+            publisher_ids[publisher.name] = next_publisher_id
+            publisher_rows.append({'id': next_publisher_id, 'name': publisher.name})
+            next_publisher_id += 1
+
+        author_rows = [dict(self.__rating_row(author), author_id=author.unique_id, full_name=author.full_name)
+                       for author in authors]
+
+        book_rows = []
+        book_author_rows = []
+        for book in books:
+            book_rows.append(dict(self.__rating_row(book), **self.__book_row(book, publisher_ids)))
+            book_author_rows.extend(self.__book_author_rows(book))
+
+        review_rows = [{
+            'user_id': user_ids.get(review.user.user_name),
+            'book_id': review.book.book_id,
+            'review_text': review.review_text,
+            'rating': review.rating,
+            'timestamp': review.timestamp
+        } for review in reviews]
+
+        with self._session_cm as scm:
+            for table, rows in ((users_table, user_rows), (publishers_table, publisher_rows), (authors_table, author_rows),
+                                (books_table, book_rows), (book_authors, book_author_rows), (reviews_table, review_rows)):
+                for start in range(0, len(rows), batch_size):
+                    scm.session.execute(table.insert(), rows[start:start + batch_size])
+            scm.commit()
+
+    @staticmethod
+    def __rating_row(entity):
+        return {
+            'ratings_count': entity.ratings_count,
+            'ratings_total': entity.ratings_total,
+            'text_reviews_count': entity.text_reviews_count,
+            'rating_histogram': entity.rating_histogram
+        }
+
+    @staticmethod
+    def __book_row(book: Book, publisher_ids: dict):
+        # the catalogue columns of a book, rating aggregates are kept separately
+        return {
+            'book_id': book.book_id,
+            'title': book.title,
+            'description': book.description,
+            'publisher_id': publisher_ids.get(book.publisher.name) if book.publisher is not None else None,
+            'release_year': book.release_year,
+            'num_pages': book.num_pages
+        }
+
+    @staticmethod
+    def __book_author_rows(book: Book):
+        return [{'book_id': book.book_id, 'author_id': author.unique_id} for author in book.authors]
+
+    @staticmethod
+    def content_hash(title, description, publisher_name, release_year, num_pages, author_ids) -> str:
+        """ Fingerprint of the catalogue fields of a book, used to spot books that changed in the source data.
+            Rating aggregates are left out, they also move with reviews written through the website. """
+        content = repr((title, description, publisher_name, release_year, num_pages, sorted(author_ids)))
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+    # INCREMENTAL SYNC
+    def sync(self, users=(), authors=(), publishers=(), books=(), reviews=(), batch_size: int = BULK_INSERT_BATCH_SIZE):
+        """ Applies the difference between the source objects and the database in one transaction, instead of
+            emptying every table and loading everything again.
+
+            Books are matched on book_id and compared by content_hash, authors on author_id and full name, publishers
+            and users on their names and reviews on (book_id, review_text, rating, timestamp). Users, their reviews
+            and reading lists that only exist in the database are kept unless the book they belong to is deleted.
+            Returns the number of inserted/updated/deleted rows per entity type.
+        """
+        session = self._session_cm.session
+        summary = {
+            'users': {'inserted': 0},
+            'publishers': {'inserted': 0, 'deleted': 0},
+            'authors': {'inserted': 0, 'updated': 0, 'deleted': 0},
+            'books': {'inserted': 0, 'updated': 0, 'deleted': 0},
+            'reviews': {'inserted': 0, 'deleted': 0}
+        }
+
+        # CURRENT DATABASE STATE
+        user_ids = {user_name: id for id, user_name in session.execute(select([users_table.c.id, users_table.c.user_name]))}
+        publisher_ids = {name: id for id, name in session.execute(select([publishers_table.c.id, publishers_table.c.name]))}
+        publisher_names = {id: name for name, id in publisher_ids.items()}
+        author_names = {author_id: full_name for author_id, full_name in
+                        session.execute(select([authors_table.c.author_id, authors_table.c.full_name]))}
+        author_ids_by_book = {}
+        for book_id, author_id in session.execute(select([book_authors.c.book_id, book_authors.c.author_id])):
+            author_ids_by_book.setdefault(book_id, []).append(author_id)
+        book_hashes = {}
+        for row in session.execute(select([books_table.c.book_id, books_table.c.title, books_table.c.description,
+                                           books_table.c.publisher_id, books_table.c.release_year, books_table.c.num_pages])):
+            book_hashes[row.book_id] = self.content_hash(row.title, row.description, publisher_names.get(row.publisher_id),
+                                                         row.release_year, row.num_pages, author_ids_by_book.get(row.book_id, []))
+        review_keys = {tuple(row) for row in session.execute(select([reviews_table.c.book_id, reviews_table.c.review_text,
+                                                                     reviews_table.c.rating, reviews_table.c.timestamp]))}
+
+        # USERS AND PUBLISHERS - new names only, ids assigned like in bulk_load
+        next_user_id = max(user_ids.values(), default=0) + 1
+        user_rows = []
+        for user in users:
+            if user.user_name not in user_ids:
+                user_ids[user.user_name] = next_user_id
+                user_rows.append({'id': next_user_id, 'user_name': user.user_name, 'password': user.password})
+                next_user_id += 1
+
+        next_publisher_id = max(publisher_ids.values(), default=0) + 1
+        publisher_rows = []
+        for publisher in publishers:
+            if publisher.name not in publisher_ids:
+                publisher_ids[publisher.name] = next_publisher_id
+                publisher_rows.append({'id': next_publisher_id, 'name': publisher.name})
+                next_publisher_id += 1
+
+        # AUTHORS
+        author_rows = []
+        author_updates = []
+        for author in authors:
+            if author.unique_id not in author_names:
+                author_rows.append(dict(self.__rating_row(author), author_id=author.unique_id, full_name=author.full_name))
+            elif author_names[author.unique_id] != author.full_name:
+                author_updates.append(author)
+
+        # BOOKS
+        book_rows = []
+        book_author_rows = []
+        book_updates = []
+        source_book_ids = set()
+        for book in books:
+            source_book_ids.add(book.book_id)
+            if book.book_id not in book_hashes:
+                book_rows.append(dict(self.__rating_row(book), **self.__book_row(book, publisher_ids)))
+                book_author_rows.extend(self.__book_author_rows(book))
+            elif book_hashes[book.book_id] != self.content_hash(
+                    book.title, book.description, book.publisher.name if book.publisher is not None else None,
+                    book.release_year, book.num_pages, [author.unique_id for author in book.authors]):
+                book_updates.append(book)
+        deleted_book_ids = [book_id for book_id in book_hashes if book_id not in source_book_ids]
+
+        # REVIEWS - only those not in the database yet, books that already exist also get their aggregates bumped
+        inserted_book_ids = {row['book_id'] for row in book_rows}
+        review_rows = []
+        rated_reviews = []
+        for review in reviews:
+            review_key = (review.book.book_id, review.review_text, review.rating, review.timestamp)
+            if review_key in review_keys:
+                continue
+            review_keys.add(review_key)
+            review_rows.append({
+                'user_id': user_ids.get(review.user.user_name),
+                'book_id': review.book.book_id,
+                'review_text': review.review_text,
+                'rating': review.rating,
+                'timestamp': review.timestamp
+            })
+            if review.book.book_id not in inserted_book_ids:
+                rated_reviews.append(review)
+
+        with self._session_cm as scm:
+            def insert(table, rows):
+                for start in range(0, len(rows), batch_size):
+                    scm.session.execute(table.insert(), rows[start:start + batch_size])
+
+            # deletes first, so updated books can't point at removed rows
+            for start in range(0, len(deleted_book_ids), batch_size):
+                batch = deleted_book_ids[start:start + batch_size]
+                summary['reviews']['deleted'] += scm.session.execute(
+                    reviews_table.delete().where(reviews_table.c.book_id.in_(batch))).rowcount
+                scm.session.execute(user_reading_lists.delete().where(user_reading_lists.c.book_id.in_(batch)))
+                scm.session.execute(book_authors.delete().where(book_authors.c.book_id.in_(batch)))
+                scm.session.execute(books_table.delete().where(books_table.c.book_id.in_(batch)))
+            summary['books']['deleted'] = len(deleted_book_ids)
+
+            insert(users_table, user_rows)
+            insert(publishers_table, publisher_rows)
+            insert(authors_table, author_rows)
+            for author in author_updates:
+                scm.session.execute(authors_table.update().where(authors_table.c.author_id == author.unique_id).values(
+                    full_name=author.full_name))
+
+            insert(books_table, book_rows)
+            insert(book_authors, book_author_rows)
+            for book in book_updates:
+                book_row = self.__book_row(book, publisher_ids)
+                del book_row['book_id']
+                scm.session.execute(books_table.update().where(books_table.c.book_id == book.book_id).values(**book_row))
+                scm.session.execute(book_authors.delete().where(book_authors.c.book_id == book.book_id))
+                insert(book_authors, self.__book_author_rows(book))
+
+            insert(reviews_table, review_rows)
+            scm.session.flush()
+            for review in rated_reviews:
+                book = scm.session.query(Book).filter(Book._Book__book_id == review.book.book_id).one()
+                book.add_rating(review.rating)
+                for author in book.authors:
+                    author.add_rating(review.rating)
+
+            # authors and publishers no book refers to anymore; the source author ids are filtered out here rather than
+            # bound into the statement, a large import has more of them than SQLite allows parameters
+            source_author_ids = {author.unique_id for author in authors}
+            orphaned_author_ids = [author_id for author_id, in scm.session.execute(select([authors_table.c.author_id]).where(
+                authors_table.c.author_id.notin_(select([book_authors.c.author_id]).where(book_authors.c.author_id.isnot(None)))))
+                if author_id not in source_author_ids]
+            for start in range(0, len(orphaned_author_ids), batch_size):
+                scm.session.execute(authors_table.delete().where(
+                    authors_table.c.author_id.in_(orphaned_author_ids[start:start + batch_size])))
+            summary['authors']['deleted'] = len(orphaned_author_ids)
+            summary['publishers']['deleted'] = scm.session.execute(publishers_table.delete().where(
+                publishers_table.c.id.notin_(select([books_table.c.publisher_id]).where(books_table.c.publisher_id.isnot(None))))
+            ).rowcount
+            scm.commit()
+
+        summary['users']['inserted'] = len(user_rows)
+        summary['publishers']['inserted'] = len(publisher_rows)
+        summary['authors']['inserted'] = len(author_rows)
+        summary['authors']['updated'] = len(author_updates)
+        summary['books']['inserted'] = len(book_rows)
+        summary['books']['updated'] = len(book_updates)
+        summary['reviews']['inserted'] = len(review_rows)
+        return summary
 
     # REPOSITORY METHODS
         # USER
@@ -57,10 +350,10 @@ class SqlAlchemyRepository(AbstractRepository):
             scm.session.add(user)
             scm.commit()
 
-    def get_user(self, user_name: str) -> User:
+    def get_user(self, user_name: str, load_profile=None) -> User:
         user = None
         try:
-            user = self._session_cm.session.query(User).filter(User._User__user_name == user_name).one()
+            user = self._session_cm.session.query(User).options(*loader_options(User, load_profile)).filter(User._User__user_name == user_name).one()
         except NoResultFound:
             pass
 
@@ -72,7 +365,7 @@ class SqlAlchemyRepository(AbstractRepository):
         # Use native SQL to retrieve ids, since there is no mapped class for the user_reading_list table.
         sql_statement = text("""INSERT INTO user_reading_lists(user_id, book_id)  VALUES(:user_id, :book_id)""")
         self._session_cm.session.execute(sql_statement, {"user_id": current_user_id, "book_id": current_book_id})
-        self._session_cm.session.commit()
+        self._session_cm.commit()
 
 
         """ Cant do this because its not mapped to anything
@@ -96,30 +389,36 @@ class SqlAlchemyRepository(AbstractRepository):
         return author
 
     def get_authors(self):
-        authors = self._session_cm.session.query(Author).order_by(asc(Author._Author__full_name)).all()
+        authors = self._read_session.query(Author).order_by(asc(Author._Author__full_name)).all()
 
         return authors
 
         # BOOK
+    def __query_books(self, load_profile=None, session=None):
+        # load_profile names an entry of orm.LOAD_PROFILES, the relationships the caller is going to touch
+        if session is None:
+            session = self._session_cm.session
+        return session.query(Book).options(*loader_options(Book, load_profile))
+
     def add_book(self, book: Book):
         with self._session_cm as scm:
             scm.session.add(book)
             scm.commit()
 
-    def get_book(self, id: int):
+    def get_book(self, id: int, load_profile=None):
         book = None
         try:
-            book = self._session_cm.session.query(Book).filter(Book._Book__book_id == id).one()
+            book = self.__query_books(load_profile).filter(Book._Book__book_id == id).one()
         except NoResultFound:
             pass
         return book
     
-    def get_all_books(self) -> List[Book]:
-        books = self._session_cm.session.query(Book).all()
+    def get_all_books(self, load_profile=None) -> List[Book]:
+        books = self.__query_books(load_profile, self._read_session).all()
         return books
 
     def get_number_of_books(self):
-        number_of_books = self._session_cm.session.query(Book).count()
+        number_of_books = self._read_session.query(Book).count()
         return number_of_books
 
         # PUBLISHER
@@ -137,7 +436,7 @@ class SqlAlchemyRepository(AbstractRepository):
         return publisher
 
     def get_publishers(self):
-        publishers = self._session_cm.session.query(Publisher).all()
+        publishers = self._read_session.query(Publisher).all()
         return publishers
 
         # REVIEW
@@ -155,72 +454,168 @@ class SqlAlchemyRepository(AbstractRepository):
 
     def get_reviews(self):
         # Reviews are accessed as a list of dictionaries: [{'book_id': 123, 'reviews': [<review1>, <review2>...]}]
-        reviews = self._session_cm.session.query(Review).all() 
-        
-        reviews_dictionary_list = []
-        for book in self.get_all_books():
-            temp_dict = {'book_id': book.book_id, 'reviews': []}
-            reviews_dictionary_list.append(temp_dict)
+        reviews_by_book_id = {}
+        for (book_id,) in self._read_session.query(Book._Book__book_id).order_by(asc(Book._Book__book_id)):
+            reviews_by_book_id[book_id] = []
+
+        for review in self._read_session.query(Review).all():
+            if review.book_id in reviews_by_book_id:
+                reviews_by_book_id[review.book_id].append(review)
+
+        return [{'book_id': book_id, 'reviews': reviews} for book_id, reviews in reviews_by_book_id.items()]
+
+    def get_reviews_for_book(self, book_id):
+        reviews = self._session_cm.session.query(Review).filter(Review.book_id == book_id).order_by(asc(Review.id)).all()
+        return reviews
+
+    def get_number_of_reviews(self, book_id):
+        number_of_reviews = self._session_cm.session.query(Review).filter(Review.book_id == book_id).count()
+        return number_of_reviews
+
+    def get_average_rating(self, book_id):
+        # the book's running aggregate - the seeded source ratings plus the reviews added here
+        book = self.get_book(book_id)
+        return book.average_rating if book is not None else None
 
-        for review in reviews:
-            for book_dictionary in reviews_dictionary_list:
-                if book_dictionary['book_id'] == review.book.book_id:
-                    book_dictionary['reviews'].append(review)
-        
-        return reviews_dictionary_list
-        
-    
         # BROWSING METHODS
+    # books_by_year_dict is no longer read, the neighbouring years are read with a keyset query (newest first); next
+    # and previous are the other way round to the memory repository, which the year pages rely on
     def get_year_of_next_book(self, books_by_year_dict, current_year):
-        keys = [key for key in books_by_year_dict.keys()]
-        current_year_index = keys.index(current_year)
-        prev_year_index = (current_year_index - 1) % len(keys)
-        prev_year = keys[prev_year_index]
-        return prev_year
+        previous_year, next_year, first_year, last_year = self.__neighbouring_keys('year', current_year)
+        return previous_year
 
     def get_year_of_previous_book(self, books_by_year_dict, current_year):
-        keys = [key for key in books_by_year_dict.keys()]
-        current_year_index = keys.index(current_year)
-        next_year_index = (current_year_index + 1) % len(keys)
-        next_year = keys[next_year_index]
+        previous_year, next_year, first_year, last_year = self.__neighbouring_keys('year', current_year)
         return next_year
 
         # RETURN LISTS OF OBJECTS ORDERED BY ATTRIBUTE
-    def get_books_for_author(self, author_name: str): 
-        """
-            -> need to use many-to-many book/author relationship for the future?
-            this method only returns a list of books for ONE auther, specified in the argument.
-            for now method just loops through authors and books lists respectively to find correct
-            books corresponding to specific author.
-        """
-        books_by_author_list = []
+    def get_books_for_author(self, author_name: str, load_profile=None):
+        # joins through book_authors, only the author's books are read
+        books = self.__query_books(load_profile, self._read_session).join(Book._Book__authors).filter(
+            Author._Author__full_name == author_name).distinct().order_by(desc(Book._Book__book_id)).all()
+        return books
 
-        authors = self._session_cm.session.query(Author).order_by(desc(Author._Author__full_name)).all()
-        author = next((author for author in authors if author.full_name == author_name), None)
-        
-        books = self._session_cm.session.query(Book).order_by(desc(Book._Book__book_id)).all()
-        for book in books:
-            for an_author in book.authors:
-                if an_author == author:
-                    books_by_author_list.append(book)
+    def get_books_for_publisher(self, publisher_name: str, load_profile=None):
+        books = self.__query_books(load_profile, self._read_session).join(Book._Book__publisher).filter(
+            Publisher._Publisher__name == publisher_name).order_by(asc(Book._Book__book_id)).all()
+        return books
 
-        return books_by_author_list
+    def get_books_for_year(self, release_year: int, load_profile=None):
+        books = self.__query_books(load_profile, self._read_session).filter(
+            Book._Book__release_year == release_year).order_by(asc(Book._Book__book_id)).all()
+        return books
 
-    def order_books_by_title(self, books):
-        books = self._session_cm.session.query(Book).order_by(asc(Book._Book__title)).all()
+    def order_books_by_title(self, books, load_profile=None):
+        books = self.__query_books(load_profile, self._read_session).order_by(
+            asc(Book._Book__title), asc(Book._Book__book_id)).all()
         return books
 
-    def order_books_by_year(self, books):
-        books = self._session_cm.session.query(Book).order_by(desc(Book._Book__release_year)).all()
-        for i in range(len(books)-1, -1, -1):
-            if books[i].release_year == None: # get rid of None - otherwise you cannot loop through release years as integers
-                books.pop(i)
+    def order_books_by_year(self, books, load_profile=None):
+        # books without a release year are left out - otherwise you cannot loop through release years as integers
+        books = self.__query_books(load_profile, self._read_session).filter(
+            Book._Book__release_year.isnot(None)).order_by(desc(Book._Book__release_year), asc(Book._Book__book_id)).all()
         return books
 
     def order_authors(self, authors):
-        authors = self._session_cm.session.query(Author).order_by(asc(Author._Author__full_name)).all()
+        authors = self._read_session.query(Author).order_by(asc(Author._Author__full_name)).all()
         return authors
 
     def order_publishers(self, publishers):
-        publishers = self._session_cm.session.query(Publisher).order_by(asc(Publisher._Publisher__name)).all()
-        return publishers
\ No newline at end of file
+        publishers = self._read_session.query(Publisher).order_by(asc(Publisher._Publisher__name)).all()
+        return publishers
+
+        # KEYS OF THE BROWSE PAGES - grouped in SQL, the books of one key are fetched with get_books_for_*
+    def get_author_names_with_books(self):
+        author_names = self._read_session.query(Author._Author__full_name).join(
+            book_authors, book_authors.c.author_id == authors_table.c.author_id).group_by(
+            Author._Author__full_name).order_by(asc(Author._Author__full_name)).all()
+        return [author_name for (author_name,) in author_names]
+
+    def get_publisher_names_with_books(self):
+        publisher_names = self._read_session.query(Publisher._Publisher__name).join(
+            books_table, books_table.c.publisher_id == publishers_table.c.id).group_by(
+            Publisher._Publisher__name).order_by(asc(Publisher._Publisher__name)).all()
+        return [publisher_name for (publisher_name,) in publisher_names]
+
+    def get_release_years(self):
+        release_years = self._read_session.query(Book._Book__release_year).filter(
+            Book._Book__release_year.isnot(None)).group_by(Book._Book__release_year).order_by(
+            desc(Book._Book__release_year)).all()
+        return [release_year for (release_year,) in release_years]
+
+        # KEYSET PAGINATION - the cursor is the key itself and its neighbours are read from the indexes on the key
+        # columns with every page. Nothing is cached between requests, so writes from other processes (e.g.
+        # manage.py database --sync) show up on the next page.
+    @staticmethod
+    def __browse_key(ordering: str):
+        """ (key column, what it is selected from, condition, descending) of a browse ordering """
+        if ordering == 'title':
+            return books_table.c.title, books_table, None, False
+        if ordering == 'year':
+            return books_table.c.release_year, books_table, books_table.c.release_year.isnot(None), True
+        if ordering == 'author':
+            return authors_table.c.full_name, authors_table.join(
+                book_authors, book_authors.c.author_id == authors_table.c.author_id), None, False
+        if ordering == 'publisher':
+            return publishers_table.c.name, publishers_table.join(
+                books_table, books_table.c.publisher_id == publishers_table.c.id), None, False
+        raise RepositoryException(f'Unknown browse ordering {ordering}')
+
+    def __key_where(self, ordering: str, aggregate, *conditions):
+        key, source, condition, descending = self.__browse_key(ordering)
+        query = select([aggregate(key)]).select_from(source)
+        for clause in (condition,) + conditions:
+            if clause is not None:
+                query = query.where(clause)
+        return query.scalar_subquery()
+
+    def __neighbouring_keys(self, ordering: str, cursor):
+        """ (previous, next, first, last) keys around cursor in the order the pages show them, in one statement.
+            Previous/next wrap around at both ends. """
+        key, source, condition, descending = self.__browse_key(ordering)
+        lowest, highest, below, above = self._read_session.execute(select([
+            self.__key_where(ordering, func.min), self.__key_where(ordering, func.max),
+            self.__key_where(ordering, func.max, key < cursor), self.__key_where(ordering, func.min, key > cursor)
+        ])).one()
+        if descending:
+            return (above if above is not None else lowest, below if below is not None else highest, highest, lowest)
+        return (below if below is not None else highest, above if above is not None else lowest, lowest, highest)
+
+    def get_browse_page(self, ordering: str, cursor=None, load_profile=None):
+        session = self._read_session
+        if cursor is None:
+            key, source, condition, descending = self.__browse_key(ordering)
+            cursor = session.execute(select([self.__key_where(ordering, func.max if descending else func.min)])).scalar()
+            if cursor is None:
+                return None
+
+        if ordering == 'title':
+            items = self.__query_books(load_profile, session).filter(
+                Book._Book__title == cursor).order_by(asc(Book._Book__book_id)).all()
+        elif ordering == 'year':
+            items = self.get_books_for_year(cursor, load_profile)
+        elif ordering == 'author':
+            items = self.get_books_for_author(cursor, load_profile)
+        else:
+            items = self.get_books_for_publisher(cursor, load_profile)
+        if len(items) == 0:
+            return None
+
+        previous_cursor, next_cursor, first_cursor, last_cursor = self.__neighbouring_keys(ordering, cursor)
+        return BrowsePage(cursor, items, previous_cursor, next_cursor, first_cursor, last_cursor)
+
+    def get_navigation_index(self, ordering: str) -> NavigationIndex:
+        # built from the current keys on every call - pages don't need it here, they step with keyset queries
+        if ordering == 'title':
+            titles = self._read_session.query(Book._Book__title).group_by(Book._Book__title).order_by(
+                asc(Book._Book__title)).all()
+            keys = [title for (title,) in titles]
+        elif ordering == 'year':
+            keys = self.get_release_years()
+        elif ordering == 'author':
+            keys = self.get_author_names_with_books()
+        elif ordering == 'publisher':
+            keys = self.get_publisher_names_with_books()
+        else:
+            raise RepositoryException(f'Unknown browse ordering {ordering}')
+        return NavigationIndex(keys)
@@ -1,5 +1,8 @@
+import os
 import json
-from typing import List
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Tuple
 from library.domain.model import Publisher, Author, Book
 from utils import get_project_root
 
@@ -33,35 +36,133 @@ class BooksJSONReader:
                 authors_json.append(author_entry)
         return authors_json
 
-    def read_json_files(self):
-        authors_json = self.read_authors_file()
-        books_json = self.read_books_file()
+    # STREAMING READER
+    def read_authors_dict(self) -> Dict[int, dict]:
+        # single pass over the authors file: {author_id: {'name': ..., 'average_rating': ..., ...}}
+        authors_dict = {}
+        with open(self.__authors_file_name, encoding='UTF-8') as authors_jsonfile:
+            for line in authors_jsonfile:
+                author_entry = json.loads(line)
+                authors_dict[int(author_entry['author_id'])] = {field: author_entry.get(field, "") for field in AUTHOR_FIELDS}
+        return authors_dict
+
+    def iter_books_file(self) -> Iterator[dict]:
+        with open(self.__books_file_name, encoding='UTF-8') as books_jsonfile:
+            for line in books_jsonfile:
+                yield json.loads(line)
 
+    # PARALLEL READER
+    def iter_books_file_parallel(self, jobs: int) -> Iterator[dict]:
+        """ Parses byte-range chunks of the books file in a process pool, results come back in file order """
+        chunks = split_into_chunks(self.__books_file_name, jobs * CHUNKS_PER_JOB)
+        starts = [start for start, end in chunks]
+        ends = [end for start, end in chunks]
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            for books_json in executor.map(parse_books_chunk, repeat(self.__books_file_name), starts, ends):
+                yield from books_json
+
+    def iter_books(self, jobs: int = 1) -> Iterator[Book]:
+        """ Yields Book objects one at a time, only the authors lookup is held in memory.
+            jobs > 1 parses the books file in parallel instead of line by line. """
+        authors_dict = self.read_authors_dict()
+        author_objects = {} # one Author object per author id, shared by all of their books
+        if jobs is not None and jobs > 1:
+            books_json = self.iter_books_file_parallel(jobs)
+        else:
+            books_json = self.iter_books_file()
         for book_json in books_json:
-            book_instance = Book(int(book_json['book_id']), book_json['title'])
-            book_instance.publisher = Publisher(book_json['publisher'])
-            if book_json['publication_year'] != "":
-                book_instance.release_year = int(book_json['publication_year'])
-            if book_json['is_ebook'].lower() == 'false':
-                book_instance.ebook = False
-            else:
-                if book_json['is_ebook'].lower() == 'true':
-                    book_instance.ebook = True
-            book_instance.description = book_json['description']
-            if book_json['num_pages'] != "":
-                book_instance.num_pages = int(book_json['num_pages'])
-
-            # extract the author ids:
-            list_of_authors_ids = book_json['authors']
-            for author_id in list_of_authors_ids:
-
-                numerical_id = int(author_id['author_id'])
-                # We assume book authors are available in the authors file,
-                # otherwise more complex handling is required.
-                author_name = None
-                for author_json in authors_json:
-                    if int(author_json['author_id']) == numerical_id:
-                        author_name = author_json['name']
-                book_instance.add_author(Author(numerical_id, author_name))
-
-            self.__dataset_of_books.append(book_instance)
\ No newline at end of file
+            yield make_book(book_json, authors_dict, author_objects)
+
+    def read_json_files(self, jobs: int = 1):
+        for book_instance in self.iter_books(jobs):
+            self.__dataset_of_books.append(book_instance)
+
+
+# CHUNKED PARSING (runs inside worker processes)
+BOOK_FIELDS = ('book_id', 'title', 'publisher', 'publication_year', 'is_ebook', 'description', 'num_pages', 'authors',
+               'average_rating', 'ratings_count', 'text_reviews_count')
+AUTHOR_FIELDS = ('name', 'average_rating', 'ratings_count', 'text_reviews_count')
+CHUNKS_PER_JOB = 4
+
+
+def split_into_chunks(file_name: str, number_of_chunks: int) -> List[Tuple[int, int]]:
+    # byte ranges [start, end) that always begin and end on a line boundary
+    file_size = os.path.getsize(file_name)
+    boundaries = [0]
+    with open(file_name, 'rb') as infile:
+        for i in range(1, number_of_chunks):
+            infile.seek(max(file_size * i // number_of_chunks, boundaries[-1]))
+            infile.readline() # skip to the start of the next line
+            boundaries.append(infile.tell())
+    boundaries.append(file_size)
+    return [(start, end) for start, end in zip(boundaries, boundaries[1:]) if start < end]
+
+
+def project_book_json(book_entry: dict) -> dict:
+    # only keep the fields make_book uses, so less data is sent back from the worker processes
+    book_json = {field: book_entry.get(field, "") for field in BOOK_FIELDS}
+    book_json['authors'] = [{'author_id': author['author_id']} for author in book_entry['authors']]
+    return book_json
+
+
+def parse_books_chunk(file_name: str, start: int, end: int) -> List[dict]:
+    books_json = []
+    with open(file_name, 'rb') as infile:
+        infile.seek(start)
+        position = start
+        while position < end:
+            line = infile.readline()
+            if not line:
+                break
+            position += len(line)
+            if line.strip():
+                books_json.append(project_book_json(json.loads(line)))
+    return books_json
+
+
+def seed_ratings(entity, entry: dict):
+    # ratings in the source files are strings and can be missing or empty
+    try:
+        average_rating = float(entry.get('average_rating', ""))
+        ratings_count = int(entry.get('ratings_count', ""))
+    except ValueError:
+        average_rating, ratings_count = None, None
+    try:
+        text_reviews_count = int(entry.get('text_reviews_count', ""))
+    except ValueError:
+        text_reviews_count = None
+    entity.seed_ratings(average_rating, ratings_count, text_reviews_count)
+
+
+def make_book(book_json: dict, authors_dict: Dict[int, dict], author_objects: Dict[int, Author] = None) -> Book:
+    book_instance = Book(int(book_json['book_id']), book_json['title'])
+    book_instance.publisher = Publisher(book_json['publisher'])
+    if book_json['publication_year'] != "":
+        book_instance.release_year = int(book_json['publication_year'])
+    if book_json['is_ebook'].lower() == 'false':
+        book_instance.ebook = False
+    else:
+        if book_json['is_ebook'].lower() == 'true':
+            book_instance.ebook = True
+    book_instance.description = book_json['description']
+    if book_json['num_pages'] != "":
+        book_instance.num_pages = int(book_json['num_pages'])
+
+    # extract the author ids:
+    list_of_authors_ids = book_json['authors']
+    for author_id in list_of_authors_ids:
+        numerical_id = int(author_id['author_id'])
+        # We assume book authors are available in the authors file,
+        # otherwise more complex handling is required.
+        if author_objects is not None and numerical_id in author_objects:
+            book_instance.add_author(author_objects[numerical_id])
+            continue
+        author_entry = authors_dict.get(numerical_id, {'name': None})
+        author = Author(numerical_id, author_entry['name'])
+        seed_ratings(author, author_entry)
+        if author_objects is not None:
+            author_objects[numerical_id] = author
+        book_instance.add_author(author)
+
+    seed_ratings(book_instance, book_json)
+    return book_instance
@@ -2,133 +2,333 @@ import csv
 import operator
 from pathlib import Path
 from datetime import datetime
-from bisect import insort_left
+from bisect import insort_left, bisect_left
+from collections.abc import Sequence
 from werkzeug.security import generate_password_hash
 
-from library.adapters.repository import AbstractRepository, RepositoryException
+from library.adapters.repository import AbstractRepository, RepositoryException, NavigationIndex, YearFacet, BULK_INSERT_BATCH_SIZE
 from library.domain.model import Publisher, Author, Book, Review, User, BooksInventory
 from library.adapters.jsondatareader import BooksJSONReader
 
 
+class ReadOnlyView(Sequence):
+    """ Read-only window onto a list the repository maintains, handed out instead of a sorted copy """
+
+    def __init__(self, items: list):
+        self.__items = items
+
+    def __getitem__(self, index):
+        return self.__items[index]
+
+    def __len__(self):
+        return len(self.__items)
+
+    def __iter__(self):
+        return iter(self.__items)
+
+    def __contains__(self, item):
+        return item in self.__items
+
+    def __eq__(self, other):
+        if isinstance(other, (list, ReadOnlyView)):
+            return self.__items == list(other)
+        return False
+
+    def __repr__(self):
+        return f'<ReadOnlyView {self.__items!r}>'
+
+
+class SortedView:
+    """ Items kept in key order on insert with bisect, so reading them in order never needs a sort """
+
+    def __init__(self):
+        self.__keys = []
+        self.__items = []
+        self.__view = ReadOnlyView(self.__items)
+
+    @property
+    def view(self) -> ReadOnlyView:
+        return self.__view
+
+    def insert(self, key, item):
+        position = bisect_left(self.__keys, key)
+        self.__keys.insert(position, key)
+        self.__items.insert(position, item)
+
+    def remove(self, key):
+        position = bisect_left(self.__keys, key)
+        if position < len(self.__keys) and self.__keys[position] == key:
+            del self.__keys[position]
+            del self.__items[position]
+
+    # GROUPS - keys are (group, tie breaker) tuples, e.g. (title, book_id); tie breakers are integers
+    def group_bounds(self, group):
+        """ [start, end) of the items whose key starts with group """
+        return bisect_left(self.__keys, (group,)), bisect_left(self.__keys, (group, float('inf')))
+
+    def items_between(self, start: int, end: int) -> list:
+        return self.__items[start:end]
+
+
 class MemoryRepository(AbstractRepository):
     def __init__(self):
         self.__users = list()
+        self.__users_index = dict()             # user_name -> User
         self.__books = []
-        self.__books_index = dict()
+        self.__books_index = dict()             # book_id -> Book
         self.__authors = list()
+        self.__authors_index = dict()           # author_id -> Author
+        self.__authors_by_name_index = dict()   # full_name -> Author
         self.__publishers = list()
-        self.__reviews = list()
+        self.__publishers_index = dict()        # name -> Publisher
+        self.__reviews = dict()                 # book_id -> [Review, ...]
+
+        # inverted indexes, each value is a sorted list of book ids
+        self.__book_ids_by_author = dict()      # author_id -> [book_id, ...]
+        self.__book_ids_by_publisher = dict()   # publisher name -> [book_id, ...]
+        self.__book_ids_by_year = dict()        # release_year -> [book_id, ...]
+        self.__indexed_keys = dict()            # book_id -> (author ids, publisher name, release year, title) it is indexed under
+
+        # orderings kept up to date on insert; ties are broken the way a stable sort of the insertion order would
+        self.__books_by_title = SortedView()        # (title, book_id)
+        self.__books_by_year = SortedView()         # (-release_year, book_id), books without a year are left out
+        self.__authors_by_name = SortedView()       # (full_name, insertion number)
+        self.__publishers_by_name = SortedView()    # (name, insertion number)
+        self.__navigation = dict()                  # browse ordering -> NavigationIndex, rebuilt after a write
+        self.__year_facet = None                    # YearFacet, rebuilt after a book is added
+
+    # BULK LOADING - nothing to batch in memory, so this just adds everything
+    def bulk_load(self, users=(), authors=(), publishers=(), books=(), reviews=(), batch_size: int = BULK_INSERT_BATCH_SIZE):
+        for user in users:
+            self.add_user(user)
+        for author in authors:
+            self.add_author(author)
+        for publisher in publishers:
+            self.add_publisher(publisher)
+        for book in books:
+            self.add_book(book)
+            self.create_review(book)
+        for review in reviews:
+            self.add_review(review.book.book_id, review)
 
     # GETTERS AND SETTERS
+    # indexes keep the first object added under a key, the same object a scan through the list would find
     def add_user(self, user: User):
         self.__users.append(user)
+        self.__users_index.setdefault(user.user_name, user)
 
-    def get_user(self, user_name):
-        return next((user for user in self.__users if user.user_name == user_name), None)
+    def get_user(self, user_name, load_profile=None):
+        return self.__users_index.get(user_name)
 
     def add_author(self, author: Author):
+        self.__navigation.pop('author', None)
+        self.__authors_by_name.insert((author.full_name, len(self.__authors)), author)
         self.__authors.append(author)
+        self.__authors_index.setdefault(author.unique_id, author)
+        self.__authors_by_name_index.setdefault(author.full_name, author)
 
     def get_author(self, author_id):
-        for author in self.__authors:
-            if author.unique_id == author_id:
-                return author
+        return self.__authors_index.get(author_id)
+
+    def get_author_by_name(self, author_name: str):
+        return self.__authors_by_name_index.get(author_name)
 
     def get_authors(self):
         return self.__authors
 
     def add_book(self, book: Book):
+        self.__navigation.clear()
+        self.__year_facet = None
         insort_left(self.__books, book)
+        # insort_left puts a re-added book in front of the old one, so the newest object wins here too
+        if book.book_id in self.__books_index:
+            self.__unindex_book(book.book_id)
         self.__books_index[book.book_id] = book
-
-    def get_book(self, id: int):
-        for book in self.__books:
-            if book.book_id == id:
-                return book
-        return None
-
-    def get_all_books(self):
+        self.__index_book(book)
+
+    def __index_book(self, book: Book):
+        # the keys are remembered so a re-added book can be unindexed even if the old object has changed since
+        author_ids = [author.unique_id for author in book.authors]
+        publisher_name = book.publisher.name if book.publisher is not None else None
+        self.__indexed_keys[book.book_id] = (author_ids, publisher_name, book.release_year, book.title)
+        self.__books_by_title.insert((book.title, book.book_id), book)
+        if book.release_year is not None:
+            self.__books_by_year.insert((-book.release_year, book.book_id), book)
+        for author_id in author_ids:
+            insort_left(self.__book_ids_by_author.setdefault(author_id, []), book.book_id)
+        if publisher_name is not None:
+            insort_left(self.__book_ids_by_publisher.setdefault(publisher_name, []), book.book_id)
+        if book.release_year is not None:
+            insort_left(self.__book_ids_by_year.setdefault(book.release_year, []), book.book_id)
+
+    def __unindex_book(self, book_id: int):
+        author_ids, publisher_name, release_year, title = self.__indexed_keys.pop(book_id)
+        self.__books_by_title.remove((title, book_id))
+        if release_year is not None:
+            self.__books_by_year.remove((-release_year, book_id))
+        for author_id in author_ids:
+            self.__book_ids_by_author[author_id].remove(book_id)
+        if publisher_name is not None:
+            self.__book_ids_by_publisher[publisher_name].remove(book_id)
+        if release_year is not None:
+            self.__book_ids_by_year[release_year].remove(book_id)
+
+    def __books_for_ids(self, book_ids):
+        return [self.__books_index[book_id] for book_id in book_ids]
+
+    def get_book(self, id: int, load_profile=None):
+        return self.__books_index.get(id)
+
+    def get_all_books(self, load_profile=None):
         return self.__books
 
     def get_number_of_books(self):
         return len(self.__books)
 
     def add_publisher(self, publisher: Publisher):
+        self.__navigation.pop('publisher', None)
+        self.__publishers_by_name.insert((publisher.name, len(self.__publishers)), publisher)
         self.__publishers.append(publisher)
+        self.__publishers_index.setdefault(publisher.name, publisher)
 
     def get_publisher(self, name):
-        for publisher in self.__publishers:
-            if publisher.name == name:
-                return publisher
+        return self.__publishers_index.get(name)
 
     def get_publishers(self):
         return self.__publishers
 
     # RETURN LISTS OF OBJECTS ORDERED BY ATTRIBUTE
-    def get_books_for_author(self, author_name: str):
-        author = next((author for author in self.__authors if author.full_name == author_name), None)
-        author_books = []
-        for book in self.__books:
-            for an_author in book.authors:
-                if author == an_author:
-                    author_books.append(book)
-        return author_books
-
-    def order_books_by_title(self, books): # SORTS BOOKS BY TITLE IN ALPHABETICAL ORDER
+    def get_books_for_author(self, author_name: str, load_profile=None):
+        author = self.get_author_by_name(author_name)
+        if author is None:
+            return []
+        return self.__books_for_ids(self.__book_ids_by_author.get(author.unique_id, []))
+
+    def get_books_for_publisher(self, publisher_name: str, load_profile=None):
+        return self.__books_for_ids(self.__book_ids_by_publisher.get(publisher_name, []))
+
+    def get_books_for_year(self, release_year: int, load_profile=None):
+        return self.__books_for_ids(self.__book_ids_by_year.get(release_year, []))
+
+    # Given the repository's own collections (what get_all_books/get_authors/get_publishers return) these hand out
+    # the maintained views, any other collection is sorted the same way.
+    def order_books_by_title(self, books=None, load_profile=None): # SORTS BOOKS BY TITLE IN ALPHABETICAL ORDER
+        if books is None or books is self.__books:
+            return self.__books_by_title.view
         books_by_title_list = sorted(books, key=operator.attrgetter("title"))
         return books_by_title_list
 
-    def order_books_by_year(self, books): # ORDERS BOOKS BY RELEASE YEAR IN DESCENDING ORDER (NEWEST TO OLDEST)
+    def order_books_by_year(self, books=None, load_profile=None): # ORDERS BOOKS BY RELEASE YEAR IN DESCENDING ORDER (NEWEST TO OLDEST)
         """ Some books dont have a release year - so we don't include them in this list """
-        with_release_year = []
-        without_release_year = []
-        for book in books:
-            if book.release_year is not None:
-                with_release_year.append(book)
-            else:
-                without_release_year.append(book)
+        if books is None or books is self.__books:
+            return self.__books_by_year.view
+        with_release_year = [book for book in books if book.release_year is not None]
         books_by_year_list = sorted(with_release_year, key=operator.attrgetter("release_year"), reverse=True)
         return books_by_year_list
 
-    def order_authors(self, authors): # SORTS AUTHORS IN ALPHABETICAL ORDER
+    def order_authors(self, authors=None): # SORTS AUTHORS IN ALPHABETICAL ORDER
+        if authors is None or authors is self.__authors:
+            return self.__authors_by_name.view
         authors_ordered = sorted(authors, key=lambda x: x.full_name)
         return authors_ordered
 
-    def order_publishers(self, publishers):
+    def order_publishers(self, publishers=None):
+        if publishers is None or publishers is self.__publishers:
+            return self.__publishers_by_name.view
         publishers_ordered = sorted(publishers, key=lambda x: x.name)
         return publishers_ordered
 
-    # METHODS FOR BROWSING BOOKS
+    # KEYS OF THE BROWSE PAGES - only keys that have books, in the order the pages step through them
+    def get_author_names_with_books(self):
+        author_names = []
+        for author in self.__authors_by_name.view:
+            if self.__book_ids_by_author.get(author.unique_id) and author.full_name not in author_names[-1:]:
+                author_names.append(author.full_name)
+        return author_names
+
+    def get_publisher_names_with_books(self):
+        publisher_names = []
+        for publisher in self.__publishers_by_name.view:
+            if self.__book_ids_by_publisher.get(publisher.name) and publisher.name not in publisher_names[-1:]:
+                publisher_names.append(publisher.name)
+        return publisher_names
+
+    def get_release_years(self):
+        return list(self.get_year_facet().years)
+
+    def get_year_facet(self):
+        if self.__year_facet is None:
+            release_years = sorted((release_year for release_year, book_ids in self.__book_ids_by_year.items() if book_ids),
+                                   reverse=True)
+            self.__year_facet = YearFacet({release_year: list(self.__book_ids_by_year[release_year])
+                                           for release_year in release_years})
+        return self.__year_facet
+
+    # KEYSET PAGINATION - neighbours come from the navigation index, the books from the maintained orderings
+    def get_browse_page(self, ordering: str, cursor=None, load_profile=None):
+        navigation = self.get_navigation_index(ordering)
+        if cursor is None:
+            cursor = navigation.first
+        if cursor not in navigation:
+            return None
+        if ordering == 'title':
+            items = self.__books_by_title.items_between(*self.__books_by_title.group_bounds(cursor))
+        elif ordering == 'year':
+            items = self.get_books_for_year(cursor)
+        elif ordering == 'author':
+            items = self.get_books_for_author(cursor)
+        else:
+            items = self.get_books_for_publisher(cursor)
+        if len(items) == 0:
+            return None
+        return navigation.page(cursor, items)
+
+    def get_navigation_index(self, ordering: str) -> NavigationIndex:
+        if ordering == 'year':
+            return self.get_year_facet().navigation
+        if ordering not in self.__navigation:
+            if ordering == 'title':
+                keys = (book.title for book in self.__books_by_title.view)
+            elif ordering == 'author':
+                keys = self.get_author_names_with_books()
+            elif ordering == 'publisher':
+                keys = self.get_publisher_names_with_books()
+            else:
+                raise RepositoryException(f'Unknown browse ordering {ordering}')
+            self.__navigation[ordering] = NavigationIndex(keys)
+        return self.__navigation[ordering]
+
+    # METHODS FOR BROWSING BOOKS - books_by_year_dict is no longer read, the years come from the year facet
     def get_year_of_previous_book(self, books_by_year_dict, current_year):
-        keys = [key for key in books_by_year_dict.keys()]
-        current_year_index = keys.index(current_year)
-        prev_year_index = (current_year_index - 1) % len(keys)
-        prev_year = keys[prev_year_index]
-        return prev_year
+        return self.get_navigation_index('year').previous(current_year)
 
     def get_year_of_next_book(self, books_by_year_dict, current_year):
-        keys = [key for key in books_by_year_dict.keys()]
-        current_year_index = keys.index(current_year)
-        next_year_index = (current_year_index + 1) % len(keys)
-        next_year = keys[next_year_index]
-        return next_year
+        return self.get_navigation_index('year').next(current_year)
 
     # METHODS FOR REVIEWS
     def create_review(self, book: Book):
-        self.__reviews.append({'book_id': book.book_id, 'reviews': []}) # stores book_id under 'book_id' and a list of respective reviews for the book under 'reviews'
+        self.__reviews.setdefault(book.book_id, [])
 
     def load_csv_review(self, book_id, review: Review):
-        for dictionary in self.__reviews:
-            if dictionary['book_id'] == book_id:
-                dictionary['reviews'].append(review)
+        self.add_review(book_id, review)
 
     def add_review(self, book_id, review: Review):
-        for dictionary in self.__reviews:
-            if dictionary['book_id'] == book_id:
-                dictionary['reviews'].append(review)
-        
+        self.__reviews.setdefault(book_id, []).append(review)
+
     def get_reviews(self):
-        return self.__reviews
+        # [{'book_id': 123, 'reviews': [<Review>, ...]}, ...] - prefer get_reviews_for_book when only one book is needed
+        return [{'book_id': book_id, 'reviews': reviews} for book_id, reviews in self.__reviews.items()]
+
+    def get_reviews_for_book(self, book_id):
+        return ReadOnlyView(self.__reviews.get(book_id, []))
+
+    def get_number_of_reviews(self, book_id):
+        return len(self.__reviews.get(book_id, []))
+
+    def get_average_rating(self, book_id):
+        # the book's running aggregate - the seeded source ratings plus the reviews added here
+        book = self.get_book(book_id)
+        return book.average_rating if book is not None else None
 
 """
 def load_books_and_authors(data_path: Path, repo: MemoryRepository):
@@ -0,0 +1,67 @@
+import os
+import pickle
+import hashlib
+import tempfile
+from pathlib import Path
+
+from library.domain import model
+from library.adapters import repository, memory_repository
+from library.adapters.memory_repository import MemoryRepository
+
+
+# Bump when the snapshot layout changes in a way the repository fingerprint doesn't pick up.
+SNAPSHOT_VERSION = 2
+
+SOURCE_FILES = ('book_authors_excerpt.json', 'comic_books_excerpt.json', 'users.csv', 'reviews.csv')
+
+# the modules whose classes are pickled into a snapshot
+PICKLED_MODULES = (model, repository, memory_repository)
+
+
+def source_fingerprint(data_path: Path) -> str:
+    """ Identifies the source data (file names, sizes and mtimes) and the code (domain model and repository modules)
+        a snapshot was built from """
+    digest = hashlib.sha256()
+    digest.update(str(SNAPSHOT_VERSION).encode())
+    # attribute names change whenever MemoryRepository gains or loses a store/index
+    digest.update(','.join(sorted(vars(MemoryRepository()).keys())).encode())
+    # any change to the pickled classes, e.g. a new private attribute on Book, makes older snapshots unusable
+    for module in PICKLED_MODULES:
+        digest.update(Path(module.__file__).read_bytes())
+    for file_name in SOURCE_FILES:
+        file_stat = (Path(data_path) / file_name).stat()
+        digest.update(f'{file_name}:{file_stat.st_size}:{file_stat.st_mtime_ns}'.encode())
+    return digest.hexdigest()
+
+
+def write_snapshot(repo: MemoryRepository, snapshot_path: Path, data_path: Path):
+    snapshot = {
+        'fingerprint': source_fingerprint(data_path),
+        'repository': repo
+    }
+    # write to a temporary file of this worker's own first, so a worker never loads a half written snapshot and
+    # workers booting together don't write into each other's file
+    snapshot_path = Path(snapshot_path)
+    file_descriptor, temp_path = tempfile.mkstemp(dir=str(snapshot_path.parent), prefix=snapshot_path.name + '.')
+    try:
+        with os.fdopen(file_descriptor, 'wb') as outfile:
+            pickle.dump(snapshot, outfile, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, str(snapshot_path))
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def load_snapshot(snapshot_path: Path, data_path: Path):
+    """ Returns the snapshotted MemoryRepository, or None if there is no snapshot or it is out of date """
+    if not os.path.exists(str(snapshot_path)):
+        return None
+    try:
+        with open(str(snapshot_path), 'rb') as infile:
+            snapshot = pickle.load(infile)
+        if snapshot['fingerprint'] != source_fingerprint(data_path) or not isinstance(snapshot['repository'], MemoryRepository):
+            return None
+        return snapshot['repository']
+    except Exception:
+        # whatever a stale or damaged snapshot raises, the repository is rebuilt from the source data
+        return None
@@ -1,8 +1,10 @@
 from sqlalchemy import (
     Table, MetaData, Column, Integer, String, Date, DateTime,
-    ForeignKey
+    Float, PickleType, ForeignKey, Index, text
+)
+from sqlalchemy.orm import (
+    backref, mapper, relationship, synonym, selectinload, joinedload, subqueryload, lazyload, raiseload
 )
-from sqlalchemy.orm import backref, mapper, relationship, synonym
 
 from library.domain import model
 
@@ -19,7 +21,8 @@ users_table = Table(
 publishers_table = Table(
     'publishers', metadata,
     Column('id', Integer, primary_key=True, autoincrement=True),
-    Column('name', String(255))
+    Column('name', String(255)),
+    Index('ix_publishers_name', 'name')                                 # get_publisher, grouping books by publisher
 )
 
 books_table = Table(
@@ -29,13 +32,26 @@ books_table = Table(
     Column('description', String(255), nullable=True),
     Column('publisher_id', ForeignKey('publishers.id'), nullable=True),
     Column('release_year', Integer),
-    Column('num_pages', Integer)
+    Column('num_pages', Integer),
+    # running rating aggregates (see model.RatingAggregate)
+    Column('ratings_count', Integer, nullable=False, server_default=text('0')),
+    Column('ratings_total', Float, nullable=False, server_default=text('0')),
+    Column('text_reviews_count', Integer, nullable=False, server_default=text('0')),
+    Column('rating_histogram', PickleType, nullable=True),
+    Index('ix_books_title', 'title'),                                   # order_books_by_title
+    Index('ix_books_release_year', 'release_year'),                     # books of a year, years with books, order_books_by_year
+    Index('ix_books_publisher_id', 'publisher_id')                      # books of a publisher
 )
 
 authors_table = Table(
     'authors', metadata,
     Column('author_id', Integer, primary_key=True),
     Column('full_name', String(255)),
+    Column('ratings_count', Integer, nullable=False, server_default=text('0')),
+    Column('ratings_total', Float, nullable=False, server_default=text('0')),
+    Column('text_reviews_count', Integer, nullable=False, server_default=text('0')),
+    Column('rating_histogram', PickleType, nullable=True),
+    Index('ix_authors_full_name', 'full_name')                          # books of an author, order_authors
 )
 
 reviews_table = Table(
@@ -45,7 +61,9 @@ reviews_table = Table(
     Column('book_id', ForeignKey('books.book_id')),
     Column('review_text', String(255)),
     Column('rating', Integer),
-    Column('timestamp', DateTime, nullable=False)
+    Column('timestamp', DateTime, nullable=False),
+    Index('ix_reviews_book_id_rating', 'book_id', 'rating'),            # reviews of a book; covers their count and average
+    Index('ix_reviews_user_id', 'user_id')                              # a user's reviews
 )
 
 # RELATIONSHIP TABLES
@@ -53,14 +71,19 @@ book_authors = Table( # ONE book, MANY authors
     'book_authors', metadata,
     Column('id', Integer, primary_key=True, autoincrement=True),
     Column('book_id', ForeignKey('books.book_id')),
-    Column('author_id', ForeignKey('authors.author_id'))
+    Column('author_id', ForeignKey('authors.author_id')),
+    # covering in both directions: the authors of a book and the books of an author
+    Index('ix_book_authors_book_id_author_id', 'book_id', 'author_id'),
+    Index('ix_book_authors_author_id_book_id', 'author_id', 'book_id')
 )
 
 user_reading_lists = Table( # ONE user, MANY books
     'user_reading_lists', metadata, 
     Column('id', Integer, primary_key=True, autoincrement=True),
     Column('user_id', ForeignKey('users.id')),
-    Column('book_id', ForeignKey('books.book_id'))
+    Column('book_id', ForeignKey('books.book_id')),
+    Index('ix_user_reading_lists_user_id_book_id', 'user_id', 'book_id'),  # a user's reading list
+    Index('ix_user_reading_lists_book_id', 'book_id')                   # removing a book
 )
 
 
@@ -80,11 +103,19 @@ def map_model_to_tables():
         '_Book__release_year': books_table.c.release_year,
         '_Book__reviews': relationship(model.Review, backref='_Review__book'),
         '_Book__authors': relationship(model.Author, secondary=book_authors),
-        '_Book__num_pages': books_table.c.num_pages
+        '_Book__num_pages': books_table.c.num_pages,
+        '_RatingAggregate__ratings_count': books_table.c.ratings_count,
+        '_RatingAggregate__ratings_total': books_table.c.ratings_total,
+        '_RatingAggregate__text_reviews_count': books_table.c.text_reviews_count,
+        '_RatingAggregate__rating_histogram': books_table.c.rating_histogram
     })
     mapper(model.Author, authors_table, properties={
         '_Author__unique_id': authors_table.c.author_id, 
         '_Author__full_name': authors_table.c.full_name,
+        '_RatingAggregate__ratings_count': authors_table.c.ratings_count,
+        '_RatingAggregate__ratings_total': authors_table.c.ratings_total,
+        '_RatingAggregate__text_reviews_count': authors_table.c.text_reviews_count,
+        '_RatingAggregate__rating_histogram': authors_table.c.rating_histogram
     })
     mapper(model.Publisher, publishers_table, properties={
         '_Publisher__id': publishers_table.c.id,
@@ -95,4 +126,62 @@ def map_model_to_tables():
         '_Review__rating': reviews_table.c.rating,
         '_Review__timestamp': reviews_table.c.timestamp
     })
-    
\ No newline at end of file
+    
+
+# LOAD PROFILES
+# How a repository query loads the relationships a view is going to touch, instead of the mappers' lazy
+# default of one query per object and relationship. A profile is a tuple of (attribute path, strategy):
+#   selectin - one extra "... WHERE id IN (...)" query per relationship, for collections
+#   joined   - a LEFT OUTER JOIN in the main query, for many-to-one relationships
+LOADER_STRATEGIES = {
+    'selectin': selectinload,
+    'joined': joinedload,
+    'subquery': subqueryload,
+    'lazy': lazyload,
+    'raise': raiseload
+}
+
+LOAD_PROFILES = {
+    # books listed or grouped by author/publisher/year
+    'listing': (
+        (('_Book__authors',), 'selectin'),
+        (('_Book__publisher',), 'joined')
+    ),
+    # books rendered by the browse pages, with their reviews
+    'browse': (
+        (('_Book__authors',), 'selectin'),
+        (('_Book__publisher',), 'joined'),
+        (('_Book__reviews',), 'selectin'),
+        (('_Book__reviews', '_Review__user'), 'selectin')
+    ),
+    # a user with the books on their reading list
+    'reading_list': (
+        (('_User__read_books',), 'selectin'),
+        (('_User__read_books', '_Book__authors'), 'selectin')
+    )
+}
+
+
+def loader_options(entity, load_profile=None) -> list:
+    """ Query options for a profile name from LOAD_PROFILES or a profile tuple, none for the mappers' defaults.
+        Paths that don't start at entity are skipped, so one profile can serve different queries. """
+    if load_profile is None:
+        return []
+    if isinstance(load_profile, str):
+        load_profile = LOAD_PROFILES[load_profile]
+
+    options = []
+    for path, strategy in load_profile:
+        if not hasattr(entity, path[0]):
+            continue
+        current_entity = entity
+        option = None
+        for attribute_name in path:
+            attribute = getattr(current_entity, attribute_name)
+            if option is None:
+                option = LOADER_STRATEGIES[strategy](attribute)
+            else:
+                option = getattr(option, LOADER_STRATEGIES[strategy].__name__)(attribute)
+            current_entity = attribute.property.mapper.class_
+        options.append(option)
+    return options
@@ -0,0 +1,82 @@
+import os
+import json
+import stat
+import hashlib
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import List
+
+from werkzeug.security import generate_password_hash
+
+from library.adapters.jsondatareader import CHUNKS_PER_JOB
+
+
+# werkzeug hashes look like 'pbkdf2:sha256:260000$<salt>$<hash>'
+PASSWORD_HASH_PREFIX = 'pbkdf2:'
+
+
+def is_password_hash(password: str) -> bool:
+    """ True for a users.csv password column that already holds a werkzeug hash """
+    return password.startswith(PASSWORD_HASH_PREFIX) and password.count('$') == 2
+
+
+def hash_passwords(passwords: List[str], jobs: int = 1) -> List[str]:
+    """ generate_password_hash for every password, spread over a process pool when jobs > 1 """
+    if jobs <= 1 or len(passwords) <= 1:
+        return [generate_password_hash(password) for password in passwords]
+    chunk_size = max(1, len(passwords) // (jobs * CHUNKS_PER_JOB))
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(generate_password_hash, passwords, chunksize=chunk_size))
+
+
+# HASH CACHE
+# Maps a user name to the hash generated for its password, plus a fingerprint of the plaintext salted with
+# that hash's salt so a changed password is spotted without running PBKDF2 again. The fingerprint is a fast
+# hash that gives no more protection than the plaintext in users.csv, so the cache file is exactly as sensitive:
+# it is only ever written readable by its owner (0600) and must be kept out of backups and shares users.csv is kept
+# out of.
+def _fingerprint(password: str, password_hash: str) -> str:
+    salt = password_hash.split('$')[1]
+    return hashlib.sha256(f'{salt}${password}'.encode('utf-8')).hexdigest()
+
+
+def load_hash_cache(cache_path) -> dict:
+    """ Returns {user_name: {'fingerprint': ..., 'hash': ...}}, empty if there is no readable cache """
+    if not cache_path or not os.path.exists(str(cache_path)):
+        return dict()
+    try:
+        with open(str(cache_path), encoding='utf-8') as infile:
+            cache = json.load(infile)
+    except (OSError, ValueError):
+        return dict()
+    return cache if isinstance(cache, dict) else dict()
+
+
+def write_hash_cache(cache_path, cache: dict):
+    # write to a temporary file of this process' own first, so an interrupted import never leaves a half written
+    # cache and imports running together don't write into each other's file. mkstemp creates it as 0600.
+    cache_path = str(cache_path)
+    file_descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(cache_path)),
+                                                  prefix=os.path.basename(cache_path) + '.')
+    try:
+        with os.fdopen(file_descriptor, 'w', encoding='utf-8') as outfile:
+            json.dump(cache, outfile)
+        os.chmod(temp_path, stat.S_IRUSR | stat.S_IWUSR)
+        os.replace(temp_path, cache_path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def cached_hash(cache: dict, user_name: str, password: str):
+    """ Returns the cached hash of a user's password, or None if it isn't cached or the password changed """
+    entry = cache.get(user_name)
+    if not isinstance(entry, dict) or not is_password_hash(entry.get('hash', '')):
+        return None
+    if entry.get('fingerprint') != _fingerprint(password, entry['hash']):
+        return None
+    return entry['hash']
+
+
+def cache_entry(password: str, password_hash: str) -> dict:
+    return {'fingerprint': _fingerprint(password, password_hash), 'hash': password_hash}
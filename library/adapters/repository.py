@@ -5,19 +5,101 @@ from library.domain.model import Publisher, Author, Book, Review, BooksInventory
 
 repo_instance = None
 
+BULK_INSERT_BATCH_SIZE = 1000 # rows per executemany when bulk loading
+
 
 class RepositoryException(Exception):
     def __init__(self, message=None):
         pass
 
 
+BROWSE_ORDERINGS = ('title', 'year', 'author', 'publisher')
+
+
+class BrowsePage:
+    """ One stop of a browse ordering - a title, release year, author or publisher name - with the books shown
+        there and the cursors of the stops around it. Previous/next wrap around at both ends, like the pages do. """
+
+    def __init__(self, cursor, items, previous_cursor, next_cursor, first_cursor, last_cursor):
+        self.cursor = cursor
+        self.items = items
+        self.previous_cursor = previous_cursor
+        self.next_cursor = next_cursor
+        self.first_cursor = first_cursor
+        self.last_cursor = last_cursor
+
+    def __repr__(self):
+        return f'<BrowsePage {self.cursor!r}: {len(self.items)} items>'
+
+
+class NavigationIndex:
+    """ Every key of a browse ordering mapped to its position and neighbours, so stepping from a key is a dict
+        lookup rather than a scan of the key list. Previous/next wrap around at both ends. """
+
+    def __init__(self, keys):
+        keys = list(dict.fromkeys(keys))
+        self.__entries = {
+            key: (position, keys[position - 1], keys[(position + 1) % len(keys)]) for position, key in enumerate(keys)
+        }
+        self.__first = keys[0] if keys else None
+        self.__last = keys[-1] if keys else None
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def __contains__(self, key):
+        return key in self.__entries
+
+    def __iter__(self):
+        return iter(self.__entries)
+
+    @property
+    def first(self):
+        return self.__first
+
+    @property
+    def last(self):
+        return self.__last
+
+    def position(self, key) -> int:
+        return self.__entries[key][0]
+
+    def previous(self, key):
+        return self.__entries[key][1]
+
+    def next(self, key):
+        return self.__entries[key][2]
+
+    def page(self, cursor, items) -> BrowsePage:
+        return BrowsePage(cursor, items, self.previous(cursor), self.next(cursor), self.__first, self.__last)
+
+
+class YearFacet:
+    """ The release years of the catalogue, newest first: the distinct years, the ids of each year's books (in
+        book id order) and the navigation between years. Only the memory repositories keep one, built once and
+        dropped when they add books; the database repository steps between years with keyset queries. """
+
+    def __init__(self, book_ids_by_year: dict):
+        self.book_ids_by_year = book_ids_by_year
+        self.years = tuple(book_ids_by_year)
+        self.navigation = NavigationIndex(self.years)
+
+
 class AbstractRepository(abc.ABC):
+    # load_profile: which relationships of the returned objects the caller will touch (see orm.LOAD_PROFILES),
+    # so the database repository can load them eagerly. Repositories holding objects in memory ignore it.
+
+    # BULK LOADING
+    @abc.abstractmethod
+    def bulk_load(self, users=(), authors=(), publishers=(), books=(), reviews=(), batch_size: int = BULK_INSERT_BATCH_SIZE):
+        raise NotImplementedError
+
     # GETTERS / SETTERS
     @abc.abstractmethod
     def add_user(self, user: User):
         raise NotImplementedError
     @abc.abstractmethod
-    def get_user(self, user_name):
+    def get_user(self, user_name, load_profile=None):
         raise NotImplementedError
 
     @abc.abstractmethod
@@ -34,10 +116,10 @@ class AbstractRepository(abc.ABC):
     def add_book(self, book: Book):
         raise NotImplementedError
     @abc.abstractmethod
-    def get_book(self, id: int):
+    def get_book(self, id: int, load_profile=None):
         raise NotImplementedError
     @abc.abstractmethod
-    def get_all_books(self):
+    def get_all_books(self, load_profile=None):
         raise NotImplementedError
     @abc.abstractmethod
     def get_number_of_books(self):
@@ -55,13 +137,19 @@ class AbstractRepository(abc.ABC):
     
     # RETURN LISTS OF OBJECTS ORDERED BY ATTRIBUTE
     @abc.abstractmethod
-    def get_books_for_author(self, author_name: str):
+    def get_books_for_author(self, author_name: str, load_profile=None):
         raise NotImplementedError
     @abc.abstractmethod
-    def order_books_by_title(self, books):
+    def get_books_for_publisher(self, publisher_name: str, load_profile=None):
         raise NotImplementedError
     @abc.abstractmethod
-    def order_books_by_year(self, books):
+    def get_books_for_year(self, release_year: int, load_profile=None):
+        raise NotImplementedError
+    @abc.abstractmethod
+    def order_books_by_title(self, books, load_profile=None):
+        raise NotImplementedError
+    @abc.abstractmethod
+    def order_books_by_year(self, books, load_profile=None):
         raise NotImplementedError
     @abc.abstractmethod
     def order_authors(self, authors):
@@ -70,6 +158,29 @@ class AbstractRepository(abc.ABC):
     def order_publishers(self, publishers):
         raise NotImplementedError
     
+    # KEYS OF THE BROWSE PAGES
+    @abc.abstractmethod
+    def get_author_names_with_books(self):
+        raise NotImplementedError
+    @abc.abstractmethod
+    def get_publisher_names_with_books(self):
+        raise NotImplementedError
+    @abc.abstractmethod
+    def get_release_years(self):
+        raise NotImplementedError
+
+    # KEYSET PAGINATION
+    @abc.abstractmethod
+    def get_browse_page(self, ordering: str, cursor=None, load_profile=None):
+        """ The BrowsePage of ordering (one of BROWSE_ORDERINGS) at cursor, the first one when cursor is None.
+            Returns None when there is nothing at cursor. """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_navigation_index(self, ordering: str) -> NavigationIndex:
+        """ The NavigationIndex over the keys of ordering, kept by the repository until its next write """
+        raise NotImplementedError
+
     # METHODS FOR BROWSING
     @abc.abstractmethod
     def get_year_of_previous_book(self, books_by_year_dict, current_year):
@@ -95,6 +206,19 @@ class AbstractRepository(abc.ABC):
     def get_reviews(self):
         raise NotImplementedError
 
+    @abc.abstractmethod
+    def get_reviews_for_book(self, book_id):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_number_of_reviews(self, book_id):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_average_rating(self, book_id):
+        """ Book.average_rating of the book, None if there is no such book or it has no ratings """
+        raise NotImplementedError
+
 
 
 
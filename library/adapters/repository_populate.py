@@ -1,19 +1,75 @@
 from pathlib import Path
 
-from library.adapters.repository import AbstractRepository
+from sqlalchemy import inspect
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import clear_mappers
+from sqlalchemy.schema import CreateColumn
+
+from library.adapters.repository import AbstractRepository, BULK_INSERT_BATCH_SIZE
 from library.adapters.data_importer import load_reviews, load_users, load_books_and_authors
+from library.adapters.orm import metadata, map_model_to_tables
+
+
+def schema_changes(database_engine) -> list:
+    """ The tables, columns and indexes of the model that the database doesn't have yet, as 'table[.column]' names """
+    inspector = inspect(database_engine)
+    existing_tables = set(inspector.get_table_names())
+    changes = []
+    for table in metadata.sorted_tables:
+        if table.name not in existing_tables:
+            changes.append(table.name)
+            continue
+        existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+        existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+        changes.extend(f'{table.name}.{column.name}' for column in table.columns if column.name not in existing_columns)
+        changes.extend(f'{table.name}.{index.name}' for index in table.indexes if index.name not in existing_indexes)
+    return changes
+
+
+def _apply(ddl, applied):
+    # a process migrating the same database at the same time may get there first, "already exists" is success
+    try:
+        ddl()
+    except DBAPIError:
+        if not applied():
+            raise
 
 
-def populate(data_path: Path, repo: AbstractRepository, database_mode: bool):
-    # Load users to repo
-    load_users(data_path, repo)
+def prepare_database(database_engine, empty_tables: bool):
+    """ Brings the schema up to date and maps the model. Run it from manage.py (or a single process), not from every
+        web worker: DDL racing between workers is tolerated but not something to rely on. """
+    clear_mappers()
+    for table in metadata.sorted_tables:
+        _apply(lambda: table.create(database_engine, checkfirst=True),
+               lambda: inspect(database_engine).has_table(table.name))
+    # create_all only creates missing tables, add the columns introduced since the database was created; every
+    # NOT NULL column added since has a server default (e.g. DEFAULT 0) that existing rows take
+    for table in metadata.sorted_tables:
+        existing_columns = {column['name'] for column in inspect(database_engine).get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing_columns:
+                column_definition = CreateColumn(column).compile(dialect=database_engine.dialect)
+                _apply(lambda: database_engine.execute(f'ALTER TABLE {table.name} ADD COLUMN {column_definition}'),
+                       lambda: column.name in {existing['name'] for existing in inspect(database_engine).get_columns(table.name)})
+    # the same goes for indexes
+    for table in metadata.sorted_tables:
+        for index in table.indexes:
+            _apply(lambda: index.create(database_engine, checkfirst=True),
+                   lambda: index.name in {existing['name'] for existing in inspect(database_engine).get_indexes(table.name)})
+    if empty_tables:
+        for table in reversed(metadata.sorted_tables):
+            database_engine.execute(table.delete())
+    map_model_to_tables()
+
+
+def populate(data_path: Path, repo: AbstractRepository, database_mode: bool, jobs: int = 1,
+             batch_size: int = BULK_INSERT_BATCH_SIZE, password_hash_cache=None):
+    # Load users to repo (in database mode they are bulk inserted along with the books)
+    if not database_mode:
+        load_users(data_path, repo, jobs, password_hash_cache)
 
     # Load books and authors into the repository.
-    load_books_and_authors(data_path, repo, database_mode)
+    load_books_and_authors(data_path, repo, database_mode, jobs, batch_size, password_hash_cache)
     
     # Load book reviews
     load_reviews(data_path, repo)
-    
-
-    
-    
\ No newline at end of file
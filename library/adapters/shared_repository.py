@@ -0,0 +1,229 @@
+from library.adapters.memory_repository import MemoryRepository
+from library.adapters.catalogue import FrozenCatalogue
+from library.adapters.repository import RepositoryException, NavigationIndex, YearFacet
+from library.domain.model import Publisher, Author, Book
+
+
+class SharedCatalogueRepository(MemoryRepository):
+    """ MemoryRepository whose books come from a FrozenCatalogue shared by all pre-forked workers.
+
+        The MemoryRepository state inherited here is this worker's overlay: users, reviews, reading lists and the
+        Book/Author/Publisher objects it has actually needed. Single book lookups and the browse pages are answered
+        from the catalogue's orderings and only materialize the books they return; anything that lists the whole
+        catalogue materializes the rest once for the lifetime of the worker. Every other MemoryRepository method
+        must either be overridden here or be one of OVERLAY_METHODS, which only touch the worker's own state.
+    """
+
+    OVERLAY_METHODS = {
+        'add_user', 'get_user', 'create_review', 'add_review', 'load_csv_review',
+        'get_reviews_for_book', 'get_number_of_reviews', 'get_year_of_previous_book', 'get_year_of_next_book',
+        'bulk_load', 'get_average_rating'
+    }
+
+    def __init__(self, catalogue: FrozenCatalogue):
+        super().__init__()
+        self.__catalogue = catalogue
+        self.__author_objects = dict()     # catalogue position -> Author
+        self.__publisher_objects = dict()  # catalogue position -> Publisher
+        self.__materialized_books = set()  # catalogue positions already added to the overlay
+        self.__fully_materialized = False
+        self.__navigation = dict()         # browse ordering -> NavigationIndex over the catalogue's keys
+        self.__year_facet = None
+
+    @property
+    def catalogue(self) -> FrozenCatalogue:
+        return self.__catalogue
+
+    @property
+    def materialized_book_ids(self) -> set:
+        return {self.__catalogue.book_id_at(position) for position in self.__materialized_books}
+
+    # MATERIALIZING THE CATALOGUE INTO THE OVERLAY
+    def __author(self, author_position: int) -> Author:
+        if author_position not in self.__author_objects:
+            self.__author_objects[author_position] = self.__catalogue.make_author(author_position)
+        return self.__author_objects[author_position]
+
+    def __publisher(self, publisher_position: int) -> Publisher:
+        if publisher_position not in self.__publisher_objects:
+            self.__publisher_objects[publisher_position] = self.__catalogue.make_publisher(publisher_position)
+        return self.__publisher_objects[publisher_position]
+
+    def __materialize_book(self, position: int):
+        if position in self.__materialized_books:
+            return
+        book = self.__catalogue.make_book(position)
+        book.publisher = self.__publisher(self.__catalogue.publisher_position_of_book(position))
+        for author_position in self.__catalogue.author_positions_of_book(position):
+            book.add_author(self.__author(author_position))
+        self.__materialized_books.add(position)
+        super().add_book(book)
+        super().create_review(book)
+
+    def materialize_all(self):
+        if self.__fully_materialized:
+            return
+        self.__fully_materialized = True
+        # authors and publishers are added in catalogue order, whatever single lookups already touched
+        for author_position in range(self.__catalogue.number_of_authors):
+            super().add_author(self.__author(author_position))
+        for publisher_position in range(self.__catalogue.number_of_publishers):
+            publisher = self.__publisher(publisher_position)
+            if publisher.name != "N/A":
+                super().add_publisher(publisher)
+        for position in range(len(self.__catalogue)):
+            self.__materialize_book(position)
+
+    # TARGETED LOOKUPS - only materialize what they return
+    def get_book(self, id: int, load_profile=None):
+        if not self.__fully_materialized:
+            position = self.__catalogue.find_book(id)
+            if position is not None:
+                self.__materialize_book(position)
+        return super().get_book(id, load_profile)
+
+    def __books_at(self, positions):
+        for position in positions:
+            self.__materialize_book(position)
+        return [super(SharedCatalogueRepository, self).get_book(self.__catalogue.book_id_at(position))
+                for position in positions]
+
+    def get_books_for_author(self, author_name: str, load_profile=None):
+        if self.__fully_materialized:
+            return super().get_books_for_author(author_name, load_profile)
+        return self.__books_at(self.__catalogue.positions_for_author_name(author_name))
+
+    def get_books_for_publisher(self, publisher_name: str, load_profile=None):
+        if self.__fully_materialized:
+            return super().get_books_for_publisher(publisher_name, load_profile)
+        return self.__books_at(self.__catalogue.positions_for_publisher_name(publisher_name))
+
+    def get_books_for_year(self, release_year: int, load_profile=None):
+        if self.__fully_materialized:
+            return super().get_books_for_year(release_year, load_profile)
+        return self.__books_at(self.__catalogue.positions_for_year(release_year))
+
+    # BROWSING - keys and neighbours come from the catalogue's orderings, only the books at the cursor are materialized
+    def get_author_names_with_books(self):
+        if self.__fully_materialized:
+            return super().get_author_names_with_books()
+        return self.__catalogue.author_names()
+
+    def get_publisher_names_with_books(self):
+        if self.__fully_materialized:
+            return super().get_publisher_names_with_books()
+        return self.__catalogue.publisher_names()
+
+    def get_release_years(self):
+        if self.__fully_materialized:
+            return super().get_release_years()
+        return list(self.get_year_facet().years)
+
+    def get_year_facet(self):
+        if self.__fully_materialized:
+            return super().get_year_facet()
+        if self.__year_facet is None:
+            self.__year_facet = YearFacet({
+                release_year: [self.__catalogue.book_id_at(position)
+                               for position in self.__catalogue.positions_for_year(release_year)]
+                for release_year in self.__catalogue.release_years()
+            })
+        return self.__year_facet
+
+    def get_navigation_index(self, ordering: str):
+        if self.__fully_materialized:
+            return super().get_navigation_index(ordering)
+        if ordering == 'year':
+            return self.get_year_facet().navigation
+        if ordering not in self.__navigation:
+            if ordering == 'title':
+                keys = self.__catalogue.titles()
+            elif ordering == 'author':
+                keys = self.__catalogue.author_names()
+            elif ordering == 'publisher':
+                keys = self.__catalogue.publisher_names()
+            else:
+                raise RepositoryException(f'Unknown browse ordering {ordering}')
+            self.__navigation[ordering] = NavigationIndex(keys)
+        return self.__navigation[ordering]
+
+    def get_browse_page(self, ordering: str, cursor=None, load_profile=None):
+        if self.__fully_materialized:
+            return super().get_browse_page(ordering, cursor, load_profile)
+        navigation = self.get_navigation_index(ordering)
+        if cursor is None:
+            cursor = navigation.first
+        if cursor not in navigation:
+            return None
+        if ordering == 'title':
+            items = self.__books_at(self.__catalogue.positions_with_title(cursor))
+        elif ordering == 'year':
+            items = self.get_books_for_year(cursor)
+        elif ordering == 'author':
+            items = self.get_books_for_author(cursor)
+        else:
+            items = self.get_books_for_publisher(cursor)
+        if len(items) == 0:
+            return None
+        return navigation.page(cursor, items)
+
+    # WHOLE CATALOGUE ACCESS
+    def add_author(self, author: Author):
+        self.materialize_all()
+        super().add_author(author)
+
+    def get_author(self, author_id):
+        self.materialize_all()
+        return super().get_author(author_id)
+
+    def get_author_by_name(self, author_name: str):
+        self.materialize_all()
+        return super().get_author_by_name(author_name)
+
+    def get_authors(self):
+        self.materialize_all()
+        return super().get_authors()
+
+    def add_book(self, book: Book):
+        self.materialize_all()
+        super().add_book(book)
+
+    def get_all_books(self, load_profile=None):
+        self.materialize_all()
+        return super().get_all_books(load_profile)
+
+    def get_number_of_books(self):
+        self.materialize_all()
+        return super().get_number_of_books()
+
+    def add_publisher(self, publisher: Publisher):
+        self.materialize_all()
+        super().add_publisher(publisher)
+
+    def get_publisher(self, name):
+        self.materialize_all()
+        return super().get_publisher(name)
+
+    def get_publishers(self):
+        self.materialize_all()
+        return super().get_publishers()
+
+    def get_reviews(self):
+        self.materialize_all()
+        return super().get_reviews()
+
+    def order_books_by_title(self, books=None, load_profile=None):
+        self.materialize_all()
+        return super().order_books_by_title(books, load_profile)
+
+    def order_books_by_year(self, books=None, load_profile=None):
+        self.materialize_all()
+        return super().order_books_by_year(books, load_profile)
+
+    def order_authors(self, authors=None):
+        self.materialize_all()
+        return super().order_authors(authors)
+
+    def order_publishers(self, publishers=None):
+        self.materialize_all()
+        return super().order_publishers(publishers)
@@ -12,15 +12,6 @@ class UnknownUserException(Exception):
 
 
 # GET CERTAIN OBJECT BY ATTRIBUTES
-def get_years(current_year, repo: AbstractRepository):
-    books = repo.get_all_books()
-    books_by_year = repo.order_books_by_year(books)
-    books_by_year_dict = get_books_by_year_dict(books_by_year)
-    prev_year = repo.get_year_of_previous_book(books_by_year_dict, current_year)
-    next_year = repo.get_year_of_next_book(books_by_year_dict, current_year)
-    return prev_year, next_year
-
-
 def get_author(author_id, repo: AbstractRepository):
     return repo.get_author(author_id)
 
@@ -29,48 +20,101 @@ def get_book(book_id, repo: AbstractRepository):
     return repo.get_book(book_id)
 
 
-def get_books_by_author(author_name, repo: AbstractRepository):
-    author_books = repo.get_books_for_author(author_name)
+def get_number_of_reviews(book_id, repo: AbstractRepository):
+    return repo.get_number_of_reviews(book_id)
+
+
+def get_books_by_author(author_name, repo: AbstractRepository, load_profile=None):
+    author_books = repo.get_books_for_author(author_name, load_profile)
     return author_books
 
 
+def get_books_by_publisher(publisher_name, repo: AbstractRepository, load_profile=None):
+    return repo.get_books_for_publisher(publisher_name, load_profile)
+
+
+def get_books_by_release_year(release_year, repo: AbstractRepository, load_profile=None):
+    return repo.get_books_for_year(release_year, load_profile)
+
+
+# KEYS OF THE BROWSE PAGES
+def get_author_names_with_books(repo: AbstractRepository):
+    return repo.get_author_names_with_books()
+
+
+def get_publisher_names_with_books(repo: AbstractRepository):
+    return repo.get_publisher_names_with_books()
+
+
+def get_release_years(repo: AbstractRepository):
+    return repo.get_release_years()
+
+
+def get_browse_page(ordering: str, cursor, repo: AbstractRepository, load_profile=None):
+    return repo.get_browse_page(ordering, cursor, load_profile)
+
+
+# GROUPING
+# A facet maps a book to the keys it is filed under, group_books files every book in one pass over the books.
+def by_release_year(book):
+    return () if book.release_year is None else (book.release_year,)
+
+
+def by_author(book):
+    return book.authors
+
+
+def by_publisher(book):
+    return () if book.publisher is None else (book.publisher,)
+
+
+def by_ebook(book):
+    return () if book.ebook is None else (book.ebook,)
+
+
+def by_page_count(bucket_size: int = 100):
+    # files a book under the first page count of its bucket, e.g. 0, 100, 200 ...
+    def page_count_bucket(book):
+        return () if book.num_pages is None else (book.num_pages // bucket_size * bucket_size,)
+    return page_count_bucket
+
+
+def group_books(books, facet, distinct: bool = False) -> dict:
+    """ {key: [<Book>, ...]} with the keys in the order they are first seen and every group in the order of books.
+        distinct drops a book that is already in the group. """
+    groups = {}
+    for book in books:
+        for key in facet(book):
+            groups.setdefault(key, []).append(book)
+    if distinct:
+        groups = {key: list(dict.fromkeys(group)) for key, group in groups.items()}
+    return groups
+
+
 # DICTIONARIES
 # DICTIONARY = {2016: [<Book>, <Book>...], 2013: [<Book>]} etc.
 def get_books_by_year_dict(books_by_year):
-    books_by_year_dict = {}
-    for book in books_by_year:
-        if book.release_year not in books_by_year_dict.keys() and book.release_year != None:
-            books_by_year_dict[book.release_year] = [book]
-        else:
-            if book.release_year != None:
-                books_by_year_dict[book.release_year].append(book)
-    return books_by_year_dict
+    return group_books(books_by_year, by_release_year)
 
 
 # DICTIONARY = {'author_name': [<book1>, <book2>], ...}
 def get_authors_by_name_dict(books, authors_by_name):
+    books_by_author = group_books(books, by_author)
     books_by_authors = {}
+    # authors sharing a name share an entry, one after the other
     for author in authors_by_name:
-        for book in books:
-            if author in book.authors:
-                if author.full_name not in books_by_authors.keys():
-                    books_by_authors[author.full_name] = [book]
-                else:
-                    books_by_authors[author.full_name].append(book)
+        if author in books_by_author:
+            books_by_authors.setdefault(author.full_name, []).extend(books_by_author[author])
     return books_by_authors
 
 
 # DICTIONARY = {'publisher_name': [<book1>, <book2>], ...}
 def get_books_by_publisher_dict(books, publishers_by_name):
+    books_by_publisher = group_books(books, by_publisher, distinct=True)
     books_by_publishers = {}
     for publisher in publishers_by_name:
-        for book in books:
-            if publisher == book.publisher:
-                if publisher.name not in books_by_publishers.keys():
-                    books_by_publishers[publisher.name] = [book]
-                else:
-                    if book not in books_by_publishers[publisher.name]:
-                        books_by_publishers[publisher.name].append(book)
+        if publisher in books_by_publisher and publisher.name not in books_by_publishers:
+            books_by_publishers[publisher.name] = books_by_publisher[publisher]
     return books_by_publishers
 
 
@@ -87,6 +131,10 @@ def add_review(book_id: int, review_text: str, rating: int, user_name: str,
         raise UnknownUserException
     review = Review(book, review_text, rating, user)
     book.add_review(review)
+    # keep the running aggregates current so pages never have to walk the reviews
+    book.add_rating(rating)
+    for author in book.authors:
+        author.add_rating(rating)
     # user.add_review(review) <- later
     repo.add_review(book_id, review)
 
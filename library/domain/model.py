@@ -36,9 +36,62 @@ class Publisher:
         return hash(self.name)
 
 
-class Author:
+class RatingAggregate:
+    """ Running rating statistics, seeded from the source data and updated one rating at a time """
+
+    def __init__(self):
+        self.__ratings_count = 0
+        self.__ratings_total = 0.0
+        self.__text_reviews_count = 0
+        self.__rating_histogram = (0, 0, 0, 0, 0) # number of 1, 2, 3, 4 and 5 star ratings added
+
+    @property
+    def ratings_count(self) -> int:
+        return self.__ratings_count or 0
+
+    @property
+    def ratings_total(self) -> float:
+        return self.__ratings_total or 0.0
+
+    @property
+    def average_rating(self) -> float:
+        if self.ratings_count == 0:
+            return None
+        return self.ratings_total / self.ratings_count
+
+    @property
+    def text_reviews_count(self) -> int:
+        return self.__text_reviews_count or 0
+
+    @property
+    def rating_histogram(self) -> tuple:
+        return self.__rating_histogram or (0, 0, 0, 0, 0)
+
+    def seed_ratings(self, average_rating: float, ratings_count: int, text_reviews_count: int = 0):
+        # the source data only has the mean and the count, so seeded ratings don't show up in the histogram
+        if isinstance(ratings_count, int) and ratings_count >= 0 and isinstance(average_rating, (int, float)):
+            self.__ratings_count = ratings_count
+            self.__ratings_total = float(average_rating) * ratings_count
+        if isinstance(text_reviews_count, int) and text_reviews_count >= 0:
+            self.__text_reviews_count = text_reviews_count
+
+    def add_rating(self, rating: int, has_text: bool = True):
+        if not isinstance(rating, int) or rating < 1 or rating > 5:
+            raise ValueError
+        self.__ratings_count = self.ratings_count + 1
+        self.__ratings_total = self.ratings_total + rating
+        if has_text:
+            self.__text_reviews_count = self.text_reviews_count + 1
+        histogram = list(self.rating_histogram)
+        histogram[rating - 1] += 1
+        # replaced rather than changed in place, so the ORM sees the new value
+        self.__rating_histogram = tuple(histogram)
+
+
+class Author(RatingAggregate):
 
     def __init__(self, author_id: int, author_full_name: str):
+        super().__init__()
         if not isinstance(author_id, int):
             raise ValueError
 
@@ -223,9 +276,10 @@ class Review:
         return f'<Review of book {self.book}, rating = {self.rating}, timestamp = {self.timestamp}>'
 
 
-class Book:
+class Book(RatingAggregate):
 
     def __init__(self, book_id: int, book_title: str):
+        super().__init__()
         if not isinstance(book_id, int):
             raise ValueError
 
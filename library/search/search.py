@@ -16,17 +16,19 @@ search_blueprint = Blueprint('search_bp', __name__)
 @search_blueprint.route('/search_book', methods=['GET', 'POST'])
 def search_book():
     form = searchForm()
-    books = utilities.get_all_books()
-    books_by_year = utilities.get_books_by_year()
-    years = [book.release_year for book in books_by_year]
-    publishers = utilities.get_publishers_by_name()
-    authors = utilities.get_authors_by_name()
-
-    books_by_authors_dict = services.get_authors_by_name_dict(books, authors)
-    books_by_year_dict = services.get_books_by_year_dict(books_by_year)
-    books_by_publisher_dict = services.get_books_by_publisher_dict(books, publishers)
 
     if form.validate_on_submit():
+        # the whole catalogue is only read when there is a keyword to search it for
+        books = utilities.get_all_books(load_profile='listing')
+        books_by_year = utilities.get_books_by_year()
+        years = [book.release_year for book in books_by_year]
+        publishers = utilities.get_publishers_by_name()
+        authors = utilities.get_authors_by_name()
+
+        books_by_authors_dict = services.get_authors_by_name_dict(books, authors)
+        books_by_year_dict = services.get_books_by_year_dict(books_by_year)
+        books_by_publisher_dict = services.get_books_by_publisher_dict(books, publishers)
+
         items_found = []
         # searches by title
         for book in books:
@@ -8,8 +8,8 @@ from flask import url_for
 
 
 # USEFUL METHODS
-def get_all_books(repo: AbstractRepository):
-    return repo.get_all_books()
+def get_all_books(repo: AbstractRepository, load_profile=None):
+    return repo.get_all_books(load_profile)
 
 
 def get_author_names(repo: AbstractRepository):
@@ -20,7 +20,7 @@ def get_author_names(repo: AbstractRepository):
 
 # SPECIAL FEATURES
 def get_readinglist_for_user(user_name, repo: AbstractRepository):
-    user = repo.get_user(user_name)
+    user = repo.get_user(user_name, load_profile='reading_list')
     if user.read_books is not None:
         return user.read_books
     else:
@@ -56,14 +56,31 @@ def get_recommended_books(reading_list, repo: AbstractRepository):
     return author_book_dict
     
 # ORDER OBJECTS BY SPECIFIC ATTRIBUTES
-def get_books_by_title(repo: AbstractRepository):
+def get_books_by_title(repo: AbstractRepository, load_profile=None):
     books = repo.get_all_books()
-    return repo.order_books_by_title(books)
+    return repo.order_books_by_title(books, load_profile)
 
 
-def get_books_by_year(repo: AbstractRepository):
+def get_books_by_year(repo: AbstractRepository, load_profile=None):
     books = repo.get_all_books()
-    return repo.order_books_by_year(books)
+    return repo.order_books_by_year(books, load_profile)
+
+
+def get_release_years(repo: AbstractRepository):
+    return repo.get_release_years()
+
+
+# KEYS OF THE BROWSE PAGES - read from the browse orderings, no book is loaded
+def get_book_titles(repo: AbstractRepository):
+    return list(repo.get_navigation_index('title'))
+
+
+def get_author_names_with_books(repo: AbstractRepository):
+    return repo.get_author_names_with_books()
+
+
+def get_publisher_names_with_books(repo: AbstractRepository):
+    return repo.get_publisher_names_with_books()
 
 
 def get_authors_by_name(repo: AbstractRepository):
@@ -76,11 +93,6 @@ def get_publishers_by_name(repo: AbstractRepository):
     return repo.order_publishers(publishers)
 
 
-# REVIEWS
-def get_reviews(repo: AbstractRepository):
-    return repo.get_reviews()
-
-
 # DICTIONARIES
 def books_to_dict(book: Book):
     book_dict = {'year': book.release_year, 'title': book.title} # no image hyperlink yet
@@ -8,8 +8,7 @@ utilities_blueprint = Blueprint('utilities_bp', __name__)
 
 # URL GENERATORS
 def get_books_and_urls():
-    books = services.get_books_by_title(repo.repo_instance)
-    book_titles = [book.title for book in books]
+    book_titles = services.get_book_titles(repo.repo_instance)
     book_urls = dict()
     for book_title in book_titles:
         book_urls[book_title] = url_for('books_bp.browse_all', title=book_title)
@@ -22,8 +21,7 @@ def get_readinglist_urls(reading_list):
     return books_and_urls
     
 def get_years_and_urls():
-    release_years = services.get_books_by_year(repo.repo_instance)
-    years = [book.release_year for book in release_years]
+    years = services.get_release_years(repo.repo_instance)
     year_urls = dict()
     for year in years:
         year_urls[year] = url_for('books_bp.books_by_year', year=year)
@@ -31,7 +29,7 @@ def get_years_and_urls():
 
 
 def get_authors_and_urls():
-    author_names = services.get_author_names(repo.repo_instance)
+    author_names = services.get_author_names_with_books(repo.repo_instance)
     author_urls = dict()
     for author_name in author_names:
         author_urls[author_name] = url_for('books_bp.books_by_author', author=author_name)
@@ -39,8 +37,7 @@ def get_authors_and_urls():
 
 
 def get_publishers_and_urls():
-    publishers = services.get_publishers_by_name(repo.repo_instance)
-    publisher_names = [publisher.name for publisher in publishers]
+    publisher_names = services.get_publisher_names_with_books(repo.repo_instance)
     publisher_urls = dict()
     for publisher_name in publisher_names:
         publisher_urls[publisher_name] = url_for('books_bp.books_by_publisher', publisher=publisher_name)
@@ -48,18 +45,18 @@ def get_publishers_and_urls():
 
 
 # ORDERED BOOK GENERATORS
-def get_all_books():
-    books = services.get_all_books(repo.repo_instance)
+def get_all_books(load_profile=None):
+    books = services.get_all_books(repo.repo_instance, load_profile)
     return books
 
    
-def get_books_by_title():
-    books_by_title = services.get_books_by_title(repo.repo_instance)
+def get_books_by_title(load_profile=None):
+    books_by_title = services.get_books_by_title(repo.repo_instance, load_profile)
     return books_by_title
 
 
-def get_books_by_year():
-    books_by_year = services.get_books_by_year(repo.repo_instance)
+def get_books_by_year(load_profile=None):
+    books_by_year = services.get_books_by_year(repo.repo_instance, load_profile)
     return books_by_year
 
 
@@ -72,9 +69,3 @@ def get_publishers_by_name():
     publishers_by_name = services.get_publishers_by_name(repo.repo_instance)
     return publishers_by_name
 
-
-# REVIEWS
-def get_reviews():
-    book_reviews_dict = services.get_reviews(repo.repo_instance)
-    return book_reviews_dict
-
@@ -0,0 +1,127 @@
+"""Offline build of the stores the web workers open.
+
+$ python manage.py database [--jobs N] [--batch-size N] [--sync]
+$ python manage.py migrate
+$ python manage.py snapshot [--jobs N] [--snapshot-path PATH]
+
+Set POPULATE_ON_STARTUP = False in .env once the database is built this way, so create_app only opens it.
+"""
+import os
+import sys
+import time
+import argparse
+from contextlib import contextmanager
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import sessionmaker
+
+from config import Config
+from library.adapters import database_repository, data_importer, memory_snapshot, repository_populate
+from library.adapters.database_engine import create_database_engine, database_engine_options
+from library.adapters.memory_repository import MemoryRepository
+from library.adapters.orm import metadata
+
+from utils import get_project_root
+
+DATA_PATH = get_project_root() / 'library' / 'adapters' / 'data'
+
+
+@contextmanager
+def step(description: str):
+    print(f"{description}...", end=' ', flush=True)
+    start = time.perf_counter()
+    yield
+    print(f"done in {time.perf_counter() - start:.2f}s")
+
+
+def build_database(args):
+    database_engine = create_database_engine(args.database_uri, **database_engine_options(vars(Config)))
+    repo_instance = database_repository.SqlAlchemyRepository(sessionmaker(autocommit=False, autoflush=True, bind=database_engine))
+    start = time.perf_counter()
+
+    with step("Preparing tables"):
+        repository_populate.prepare_database(database_engine, empty_tables=not args.sync)
+
+    with step(f"Reading source files from {args.data_path} ({args.jobs} job(s))"):
+        objects = data_importer.build_database_objects(args.data_path, args.jobs, args.password_hash_cache)
+    for entity, entities in objects.items():
+        print(f"  {entity}: {len(entities)} read")
+
+    if args.sync:
+        with step("Syncing changes"):
+            summary = repo_instance.sync(batch_size=args.batch_size, **objects)
+        for entity, changes in summary.items():
+            print(f"  {entity}: " + ", ".join(f"{count} {change}" for change, count in changes.items()))
+    else:
+        with step(f"Inserting rows (batches of {args.batch_size})"):
+            repo_instance.bulk_load(batch_size=args.batch_size, **objects)
+
+    print("Row counts:")
+    with database_engine.connect() as connection:
+        for table in metadata.sorted_tables:
+            number_of_rows = connection.execute(select([func.count()]).select_from(table)).scalar()
+            print(f"  {table.name}: {number_of_rows}")
+    print(f"Built {args.database_uri} in {time.perf_counter() - start:.2f}s")
+
+
+def migrate_database(args):
+    database_engine = create_database_engine(args.database_uri, **database_engine_options(vars(Config)))
+    missing = repository_populate.schema_changes(database_engine)
+    with step(f"Adding {len(missing)} missing table(s), column(s) and index(es)"):
+        repository_populate.prepare_database(database_engine, empty_tables=False)
+    for name in missing:
+        print(f"  {name}")
+
+
+def build_snapshot(args):
+    if not args.snapshot_path:
+        sys.exit("No snapshot path, pass --snapshot-path or set MEMORY_SNAPSHOT_PATH in .env")
+    repo_instance = MemoryRepository()
+    start = time.perf_counter()
+
+    with step(f"Populating memory repository from {args.data_path} ({args.jobs} job(s))"):
+        database_mode = False
+        repository_populate.populate(args.data_path, repo_instance, database_mode, args.jobs,
+                                     password_hash_cache=args.password_hash_cache)
+    print(f"  authors: {len(repo_instance.get_authors())}")
+    print(f"  publishers: {len(repo_instance.get_publishers())}")
+    print(f"  books: {repo_instance.get_number_of_books()}")
+    print(f"  reviews: {sum(len(entry['reviews']) for entry in repo_instance.get_reviews())}")
+
+    with step(f"Writing snapshot to {args.snapshot_path}"):
+        memory_snapshot.write_snapshot(repo_instance, args.snapshot_path, args.data_path)
+    print(f"Built {args.snapshot_path} ({os.path.getsize(args.snapshot_path)} bytes) in {time.perf_counter() - start:.2f}s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the library database or memory snapshot offline.")
+    parser.add_argument('--data-path', default=DATA_PATH, type=lambda path: get_project_root() / path,
+                        help="directory holding the JSON and CSV source files")
+    parser.add_argument('--jobs', default=Config.DATA_IMPORT_JOBS, type=int,
+                        help="processes used to parse the books file and hash passwords")
+    parser.add_argument('--password-hash-cache', default=Config.PASSWORD_HASH_CACHE_PATH,
+                        help="JSON file the hashes of user passwords are reused from and saved to")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    database_parser = commands.add_parser('database', help="create and populate the database")
+    database_parser.add_argument('--database-uri', default=Config.SQLALCHEMY_DATABASE_URI)
+    database_parser.add_argument('--batch-size', default=Config.BULK_INSERT_BATCH_SIZE, type=int,
+                                 help="rows per insert statement")
+    database_parser.add_argument('--sync', action='store_true',
+                                 help="only apply the changes in the source files instead of rebuilding every table")
+    database_parser.set_defaults(build=build_database)
+
+    migrate_parser = commands.add_parser('migrate', help="bring an existing database's schema up to date, keeping its rows")
+    migrate_parser.add_argument('--database-uri', default=Config.SQLALCHEMY_DATABASE_URI)
+    migrate_parser.set_defaults(build=migrate_database)
+
+    snapshot_parser = commands.add_parser('snapshot', help="populate a memory repository and write its snapshot")
+    snapshot_parser.add_argument('--snapshot-path', default=Config.MEMORY_SNAPSHOT_PATH)
+    snapshot_parser.set_defaults(build=build_snapshot)
+
+    args = parser.parse_args(argv)
+    args.build(args)
+
+
+if __name__ == "__main__":
+    main()
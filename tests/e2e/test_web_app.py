@@ -1,6 +1,13 @@
 import pytest
 from flask import session
 
+import library.adapters.repository as repo
+from library import create_app
+
+from utils import get_project_root
+
+TEST_DATA_PATH = get_project_root() / "tests" / "data"
+
 
 def test_register(client):
     response_code = client.get('/authentication/register').status_code
@@ -51,3 +58,57 @@ def test_index(client):
     response = client.get('/')
     assert response.status_code == 200
     assert b'ASSEMBLED ABNORMALLY' in response.data
+
+
+def test_browse_by_year_author_and_publisher(client):
+    response = client.get('/books_by_year?year=2016')
+    assert response.status_code == 200
+    assert b'Books by release year' in response.data
+    # 2016 is the newest year: the one before it is 2014, the one after it wraps around to the oldest
+    assert b"year=2014'\">Previous" in response.data
+    assert b"year=1997'\">Next" in response.data
+    response = client.get('/books_by_author?author=Naoki Urasawa')
+    assert response.status_code == 200
+    assert b'20th Century Boys, Volume 19' in response.data
+    response = client.get('/books_by_publisher')
+    assert response.status_code == 200
+    assert b'Avatar Press' in response.data
+
+def test_shared_catalogue_browse_pages_only_materialize_the_books_shown():
+    client = create_app({
+        'TESTING': True,
+        'REPOSITORY': 'memory',
+        'SHARED_CATALOGUE': True,
+        'TEST_DATA_PATH': TEST_DATA_PATH,
+        'WTF_CSRF_ENABLED': False
+    }).test_client()
+    assert client.get('/').status_code == 200
+    assert client.get('/search_book').status_code == 200
+    assert repo.repo_instance.materialized_book_ids == set()
+
+    shown = set()
+    for url, ordering in [('/browse_all', 'title'), ('/books_by_year?year=2016', 'year'),
+                          ('/books_by_author?author=Naoki Urasawa', 'author'), ('/books_by_publisher', 'publisher')]:
+        assert client.get(url).status_code == 200
+        cursor = url.partition('=')[2] or None
+        page = repo.repo_instance.get_browse_page(ordering, int(cursor) if ordering == 'year' else cursor)
+        shown |= {book.book_id for book in page.items}
+        assert repo.repo_instance.materialized_book_ids == shown
+    assert len(shown) < len(repo.repo_instance.catalogue)
+
+
+def test_browse_unknown_key_is_not_found(client):
+    assert client.get('/books_by_author?author=No Such Author').status_code == 404
+    assert client.get('/books_by_year?year=1066').status_code == 404
+    assert client.get('/browse_all?title=No Such Title').status_code == 404
+
+def test_browse_all_only_reads_the_current_books_reviews(client, auth, monkeypatch):
+    client.post('/authentication/register', data={'user_name': 'gmichael', 'password': 'CarelessWhisper1984'})
+    auth.login('gmichael', 'CarelessWhisper1984')
+    client.post('/review', data={'review': 'Loved it', 'rating': 5, 'book_id': 2168737})
+    def get_reviews():
+        pytest.fail("browse_all read every review")
+    monkeypatch.setattr(repo.repo_instance, 'get_reviews', get_reviews)
+    response = client.get('/browse_all?title=The Thing: Idol of Millions&view_reviews=2168737')
+    assert response.status_code == 200
+    assert b'Loved it' in response.data
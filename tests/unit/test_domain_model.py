@@ -3,8 +3,8 @@ import pytest
 
 from utils import get_project_root
 
-from library.domain.model import Publisher, Author, Book, Review, User, BooksInventory
-from library.adapters.jsondatareader import BooksJSONReader
+from library.domain.model import Publisher, Author, Book, Review, User, BooksInventory, RatingAggregate
+from library.adapters.jsondatareader import BooksJSONReader, split_into_chunks, parse_books_chunk
 
 
 class TestPublisher:
@@ -402,6 +402,30 @@ class TestUser:
         assert user2.password is None
 
 
+class TestRatingAggregate:
+    def test_seeded_and_added_ratings(self):
+        book = Book(84765876, "Harry Potter")
+        assert book.ratings_count == 0
+        assert book.average_rating is None
+        book.seed_ratings(4.0, 10, 3)
+        assert book.average_rating == 4.0
+        book.add_rating(5)
+        assert book.ratings_count == 11
+        assert book.text_reviews_count == 4
+        assert book.average_rating == 45 / 11
+        assert book.rating_histogram == (0, 0, 0, 0, 1)
+
+    def test_invalid_ratings(self):
+        author = Author(3675, "J.K. Rowling")
+        with pytest.raises(ValueError):
+            author.add_rating(6)
+        author.seed_ratings(None, None)
+        assert author.ratings_count == 0
+        author.add_rating(2, has_text=False)
+        assert author.rating_histogram == (0, 1, 0, 0, 0)
+        assert author.text_reviews_count == 0
+
+
 @pytest.fixture
 def read_books_and_authors():
     books_file_name = 'comic_books_excerpt.json'
@@ -434,4 +458,47 @@ class TestBooksJSONReader:
 
     def test_read_books_from_file_and_check_other_attributes(self, read_books_and_authors):
         dataset_of_books = read_books_and_authors
-        assert dataset_of_books[2].release_year == 2012
\ No newline at end of file
+        assert dataset_of_books[2].release_year == 2012
+
+    def test_iter_books_streams_the_same_books(self, read_books_and_authors):
+        data_folder = get_project_root().joinpath("library/adapters/data")
+        reader = BooksJSONReader(data_folder.joinpath('comic_books_excerpt.json'), data_folder.joinpath('book_authors_excerpt.json'))
+        streamed_books = list(reader.iter_books())
+        assert streamed_books == read_books_and_authors
+        assert [book.authors for book in streamed_books] == [book.authors for book in read_books_and_authors]
+        assert reader.dataset_of_books == []
+
+
+    def test_split_into_chunks_covers_file_on_line_boundaries(self):
+        books_file = get_project_root().joinpath("library/adapters/data/comic_books_excerpt.json")
+        chunks = split_into_chunks(str(books_file), 7)
+        assert chunks[0][0] == 0
+        assert chunks[-1][1] == books_file.stat().st_size
+        for (start, end), (next_start, next_end) in zip(chunks, chunks[1:]):
+            assert end == next_start
+        books_json = []
+        for start, end in chunks:
+            books_json.extend(parse_books_chunk(str(books_file), start, end))
+        assert len(books_json) == 20
+
+    def test_iter_books_in_parallel(self, read_books_and_authors):
+        data_folder = get_project_root().joinpath("library/adapters/data")
+        reader = BooksJSONReader(data_folder.joinpath('comic_books_excerpt.json'), data_folder.joinpath('book_authors_excerpt.json'))
+        parallel_books = list(reader.iter_books(jobs=2))
+        assert parallel_books == read_books_and_authors
+        assert [book.authors for book in parallel_books] == [book.authors for book in read_books_and_authors]
+        assert [book.description for book in parallel_books] == [book.description for book in read_books_and_authors]
+
+    def test_ratings_are_seeded_from_source(self, read_books_and_authors):
+        book = read_books_and_authors[0]
+        assert book.ratings_count == 1
+        assert book.text_reviews_count == 1
+        assert round(book.average_rating, 2) == 4.12
+        author = book.authors[0]
+        assert author.ratings_count > 0
+
+    def test_authors_are_shared_between_books(self, read_books_and_authors):
+        authors = {}
+        for book in read_books_and_authors:
+            for author in book.authors:
+                assert authors.setdefault(author.unique_id, author) is author
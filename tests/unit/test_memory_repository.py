@@ -1,7 +1,25 @@
+import os
+import stat
+import types
+import pickle
+import shutil
 import pytest
+from concurrent.futures import ThreadPoolExecutor
 from library.books.services import get_books_by_publisher_dict, get_books_by_year_dict, get_authors_by_name_dict
 from library.domain.model import Review, Author, User, Book
+from library.books.services import add_review, group_books, by_ebook, by_page_count
 from library.utilities.services import get_all_books, get_publishers_by_name, get_books_by_year, get_authors_by_name, get_recommended_books
+from library.domain import model
+from library.adapters import memory_snapshot
+from library.adapters.memory_snapshot import write_snapshot, load_snapshot
+from library.adapters.memory_repository import MemoryRepository
+from library.adapters.shared_repository import SharedCatalogueRepository
+from library.adapters.data_importer import load_catalogue, read_users
+from werkzeug.security import check_password_hash
+
+from utils import get_project_root
+
+TEST_DATA_PATH = get_project_root() / "tests" / "data"
 
 
 class TestMemoryRepository:
@@ -15,6 +33,30 @@ class TestMemoryRepository:
             if book_id in item.keys():
                 assert review in item[book_id]
 
+    def test_reviews_for_book(self, in_memory_repo):
+        book = in_memory_repo.get_book(30128855)
+        test_user = User('kayra', 'password123')
+        assert in_memory_repo.get_number_of_reviews(30128855) == 0
+        assert in_memory_repo.get_average_rating(30128855) == book.average_rating
+        first_review = Review(book, "review haha", 3, test_user)
+        second_review = Review(book, "second review", 4, test_user)
+        in_memory_repo.add_review(30128855, first_review)
+        in_memory_repo.add_review(30128855, second_review)
+        assert list(in_memory_repo.get_reviews_for_book(30128855)) == [first_review, second_review]
+        assert in_memory_repo.get_number_of_reviews(30128855) == 2
+        assert in_memory_repo.get_average_rating(1) is None
+        assert len(in_memory_repo.get_reviews_for_book(13340336)) == 0
+
+    def test_add_review_updates_rating_aggregates(self, in_memory_repo):
+        book = in_memory_repo.get_book(30128855)
+        author = book.authors[0]
+        book_count, author_count = book.ratings_count, author.ratings_count
+        add_review(30128855, "Loved it", 5, 'fmercury', in_memory_repo)
+        assert book.ratings_count == book_count + 1
+        assert book.rating_histogram == (0, 0, 0, 0, 1)
+        assert in_memory_repo.get_author(author.unique_id).ratings_count == author_count + 1
+        assert in_memory_repo.get_average_rating(30128855) == book.average_rating
+
     def test_reading_list(self, in_memory_repo):
         user = User("haydengray", "")
         in_memory_repo.add_user(user)
@@ -83,6 +125,35 @@ class TestMemoryRepository:
                 all_pubs_match = False
         assert len(items_found) == items_should_be_found and all_pubs_match
 
+    def test_grouped_dictionaries_match_scanning_every_pair(self, in_memory_repo):
+        books = get_all_books(in_memory_repo)
+        authors = get_authors_by_name(in_memory_repo)
+        publishers = get_publishers_by_name(in_memory_repo)
+        books_by_authors = {}
+        for author in authors:
+            for book in books:
+                if author in book.authors:
+                    books_by_authors.setdefault(author.full_name, []).append(book)
+        books_by_publishers = {}
+        for publisher in publishers:
+            for book in books:
+                if publisher == book.publisher and book not in books_by_publishers.get(publisher.name, []):
+                    books_by_publishers.setdefault(publisher.name, []).append(book)
+        assert get_authors_by_name_dict(books, authors) == books_by_authors
+        assert list(get_authors_by_name_dict(books, authors)) == list(books_by_authors)
+        assert get_books_by_publisher_dict(books, publishers) == books_by_publishers
+        assert list(get_books_by_publisher_dict(books, publishers)) == list(books_by_publishers)
+
+    def test_group_books_by_ebook_and_page_count(self, in_memory_repo):
+        books = get_all_books(in_memory_repo)
+        books_by_ebook = group_books(books, by_ebook)
+        assert set(books_by_ebook) <= {True, False}
+        assert all(book.ebook is ebook for ebook, group in books_by_ebook.items() for book in group)
+        books_by_pages = group_books(books, by_page_count(50))
+        assert all(bucket <= book.num_pages < bucket + 50 for bucket, group in books_by_pages.items() for book in group)
+        assert sum(len(group) for group in books_by_pages.values()) == \
+            len([book for book in books if book.num_pages is not None])
+
     def test_search_release_year(self, in_memory_repo):
         search_field = 2016
         items_should_be_found = 5
@@ -120,8 +191,256 @@ class TestMemoryRepository:
         in_memory_repo.add_user(user)
         assert user == in_memory_repo.get_user("haydengray")
 
+    def test_indexed_lookups(self, in_memory_repo):
+        author = Author(1, "Hayden Gray")
+        in_memory_repo.add_author(author)
+        assert in_memory_repo.get_author(1) is author
+        assert in_memory_repo.get_author_by_name("Hayden Gray") is author
+        assert in_memory_repo.get_author(2) is None
+        assert in_memory_repo.get_publisher("Avatar Press").name == "Avatar Press"
+        assert in_memory_repo.get_publisher("No Such Press") is None
+        assert in_memory_repo.get_user("prince") is None
+
+    def test_books_for_author_publisher_and_year(self, in_memory_repo):
+        books = in_memory_repo.get_books_for_author("Naoki Urasawa")
+        assert len(books) == 3
+        assert books == sorted(books)
+        assert in_memory_repo.get_books_for_author("Nobody") == []
+        books = in_memory_repo.get_books_for_publisher("Avatar Press")
+        assert len(books) == 4
+        assert all(book.publisher.name == "Avatar Press" for book in books)
+        books = in_memory_repo.get_books_for_year(2016)
+        assert len(books) == 5
+        assert all(book.release_year == 2016 for book in books)
+        assert in_memory_repo.get_books_for_year(1066) == []
+
+    def test_browse_keys_match_dictionaries(self, in_memory_repo):
+        books = get_all_books(in_memory_repo)
+        assert in_memory_repo.get_publisher_names_with_books() == \
+            list(get_books_by_publisher_dict(books, get_publishers_by_name(in_memory_repo)))
+        assert in_memory_repo.get_author_names_with_books() == \
+            list(get_authors_by_name_dict(books, get_authors_by_name(in_memory_repo)))
+        assert in_memory_repo.get_release_years() == list(get_books_by_year_dict(get_books_by_year(in_memory_repo)))
+
+    def test_browse_pages_walk_the_browse_keys(self, in_memory_repo):
+        keys = {
+            'title': list(dict.fromkeys(book.title for book in in_memory_repo.order_books_by_title())),
+            'year': in_memory_repo.get_release_years(),
+            'author': in_memory_repo.get_author_names_with_books(),
+            'publisher': in_memory_repo.get_publisher_names_with_books()
+        }
+        for ordering, ordering_keys in keys.items():
+            page = in_memory_repo.get_browse_page(ordering)
+            assert (page.first_cursor, page.last_cursor) == (ordering_keys[0], ordering_keys[-1])
+            visited = []
+            while page.cursor not in visited:
+                visited.append(page.cursor)
+                assert len(page.items) > 0
+                assert in_memory_repo.get_browse_page(ordering, page.next_cursor).previous_cursor == page.cursor
+                page = in_memory_repo.get_browse_page(ordering, page.next_cursor)
+            assert visited == ordering_keys
+        assert in_memory_repo.get_browse_page('year', 2016).items == in_memory_repo.get_books_for_year(2016)
+        assert in_memory_repo.get_browse_page('author', "No Such Author") is None
+
+    def test_year_neighbours_come_from_the_navigation_index(self, in_memory_repo):
+        release_years = in_memory_repo.get_release_years()
+        for position, release_year in enumerate(release_years):
+            assert in_memory_repo.get_year_of_previous_book(None, release_year) == release_years[position - 1]
+            assert in_memory_repo.get_year_of_next_book(None, release_year) == \
+                release_years[(position + 1) % len(release_years)]
+        assert in_memory_repo.get_navigation_index('year').position(release_years[-1]) == len(release_years) - 1
+
+        book = Book(1, "Domesday Book")
+        book.release_year = 1066
+        in_memory_repo.add_book(book)
+        assert in_memory_repo.get_navigation_index('year').last == 1066
+        assert in_memory_repo.get_year_of_next_book(None, 1066) == release_years[0]
+
+    def test_year_facet_is_cached_until_a_book_is_added(self, in_memory_repo):
+        year_facet = in_memory_repo.get_year_facet()
+        assert in_memory_repo.get_year_facet() is year_facet
+        assert list(year_facet.years) == in_memory_repo.get_release_years()
+        for release_year in year_facet.years:
+            assert year_facet.book_ids_by_year[release_year] == \
+                [book.book_id for book in in_memory_repo.get_books_for_year(release_year)]
+
+        book = Book(1, "Domesday Book")
+        book.release_year = 1066
+        in_memory_repo.add_book(book)
+        assert in_memory_repo.get_year_facet() is not year_facet
+        assert in_memory_repo.get_year_facet().book_ids_by_year[1066] == [1]
+
+    def test_inverted_indexes_follow_re_added_book(self, in_memory_repo):
+        book = Book(30128855, "Cruelle")
+        book.release_year = 1066
+        in_memory_repo.add_book(book)
+        assert book in in_memory_repo.get_books_for_year(1066)
+        assert book not in in_memory_repo.get_books_for_year(2016)
+        assert book not in in_memory_repo.get_books_for_publisher("Dargaud")
+
+    def test_maintained_orderings_match_sorting(self, in_memory_repo):
+        books = in_memory_repo.get_all_books()
+        assert list(in_memory_repo.order_books_by_title(books)) == sorted(books, key=lambda book: book.title)
+        with_year = [book for book in books if book.release_year is not None]
+        assert list(in_memory_repo.order_books_by_year(books)) == sorted(with_year, key=lambda book: book.release_year, reverse=True)
+        authors = in_memory_repo.get_authors()
+        assert list(in_memory_repo.order_authors(authors)) == sorted(authors, key=lambda author: author.full_name)
+        publishers = in_memory_repo.get_publishers()
+        assert list(in_memory_repo.order_publishers(publishers)) == sorted(publishers, key=lambda publisher: publisher.name)
+
+    def test_maintained_orderings_are_updated_on_insert(self, in_memory_repo):
+        books_by_title = in_memory_repo.order_books_by_title(in_memory_repo.get_all_books())
+        book = Book(1, "0 First Title")
+        book.release_year = 2099
+        in_memory_repo.add_book(book)
+        assert books_by_title[0] is book
+        assert in_memory_repo.order_books_by_year(in_memory_repo.get_all_books())[0] is book
+        in_memory_repo.add_author(Author(1, "Aaron Aardvark"))
+        assert in_memory_repo.order_authors(in_memory_repo.get_authors())[0].full_name == "Aaron Aardvark"
+        assert not hasattr(books_by_title, 'append')
+
+    def test_re_added_book_replaces_the_old_one(self, in_memory_repo):
+        book = Book(30128855, "Cruelle")
+        in_memory_repo.add_book(book)
+        assert in_memory_repo.get_book(30128855) is book
+
+    def test_snapshot_round_trip(self, in_memory_repo, tmp_path):
+        snapshot_path = tmp_path / 'library.snapshot'
+        write_snapshot(in_memory_repo, snapshot_path, TEST_DATA_PATH)
+        repo = load_snapshot(snapshot_path, TEST_DATA_PATH)
+        assert repo.get_all_books() == in_memory_repo.get_all_books()
+        assert repo.get_authors() == in_memory_repo.get_authors()
+        assert repo.get_user('fmercury') == in_memory_repo.get_user('fmercury')
+        assert repo.get_book(30128855).authors == in_memory_repo.get_book(30128855).authors
+
+    def test_snapshot_is_invalidated_when_source_changes(self, in_memory_repo, tmp_path):
+        data_path = tmp_path / 'data'
+        shutil.copytree(TEST_DATA_PATH, data_path)
+        snapshot_path = tmp_path / 'library.snapshot'
+        assert load_snapshot(snapshot_path, data_path) is None
+        write_snapshot(in_memory_repo, snapshot_path, data_path)
+        assert load_snapshot(snapshot_path, data_path) is not None
+        users_file = data_path / 'users.csv'
+        file_stat = users_file.stat()
+        os.utime(users_file, ns=(file_stat.st_atime_ns, file_stat.st_mtime_ns + 1000000000))
+        assert load_snapshot(snapshot_path, data_path) is None
+
+    def test_snapshot_is_invalidated_when_the_model_changes(self, in_memory_repo, tmp_path, monkeypatch):
+        model_source = tmp_path / 'model.py'
+        shutil.copy(model.__file__, model_source)
+        monkeypatch.setattr(memory_snapshot, 'PICKLED_MODULES', (types.SimpleNamespace(__file__=str(model_source)),))
+        snapshot_path = tmp_path / 'library.snapshot'
+        write_snapshot(in_memory_repo, snapshot_path, TEST_DATA_PATH)
+        assert load_snapshot(snapshot_path, TEST_DATA_PATH) is not None
+        with open(model_source, 'a') as outfile:
+            outfile.write('\n# a new attribute\n')
+        assert load_snapshot(snapshot_path, TEST_DATA_PATH) is None
+
+    def test_concurrent_snapshot_writes_use_their_own_temp_files(self, in_memory_repo, tmp_path):
+        snapshot_path = tmp_path / 'library.snapshot'
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(lambda _: write_snapshot(in_memory_repo, snapshot_path, TEST_DATA_PATH), range(8)))
+        assert os.listdir(tmp_path) == ['library.snapshot']
+        assert load_snapshot(snapshot_path, TEST_DATA_PATH) is not None
+
+    def test_unreadable_snapshot_is_a_cache_miss(self, tmp_path):
+        snapshot_path = tmp_path / 'library.snapshot'
+        with open(snapshot_path, 'wb') as outfile:
+            pickle.dump(['not', 'a', 'snapshot'], outfile)
+        assert load_snapshot(snapshot_path, TEST_DATA_PATH) is None
+
+
+class TestUserImport:
+    def test_passwords_hashed_in_process_pool(self):
+        users = read_users(TEST_DATA_PATH, jobs=2)
+        assert [user.user_name for user in users] == ['fmercury', 'mjackson', 'test_user']
+        assert check_password_hash(users[2].password, 'Password1')
+
+    def test_pre_hashed_passwords_are_kept(self, tmp_path):
+        password_hash = read_users(TEST_DATA_PATH)[0].password
+        with open(tmp_path / 'users.csv', 'w') as outfile:
+            outfile.write(f'id,username,password\n1,fmercury,{password_hash}\n')
+        assert read_users(tmp_path)[0].password == password_hash
+
+    def test_hash_cache_reuses_unchanged_passwords(self, tmp_path):
+        cache_path = tmp_path / 'password_hashes.json'
+        first_import = read_users(TEST_DATA_PATH, password_hash_cache=cache_path)
+        second_import = read_users(TEST_DATA_PATH, password_hash_cache=cache_path)
+        assert [user.password for user in second_import] == [user.password for user in first_import]
+
+        with open(TEST_DATA_PATH / 'users.csv') as infile:
+            users_csv = infile.read()
+        with open(tmp_path / 'users.csv', 'w') as outfile:
+            outfile.write(users_csv.replace('test_user,Password1', 'test_user,NewPassword2'))
+        changed_import = read_users(tmp_path, password_hash_cache=cache_path)
+        assert changed_import[0].password == first_import[0].password
+        assert check_password_hash(changed_import[2].password, 'NewPassword2')
+
+    def test_hash_cache_is_only_readable_by_its_owner(self, tmp_path):
+        cache_path = tmp_path / 'password_hashes.json'
+        read_users(TEST_DATA_PATH, password_hash_cache=cache_path)
+        assert stat.S_IMODE(os.stat(cache_path).st_mode) == 0o600
+        assert os.listdir(tmp_path) == ['password_hashes.json']
+
+
+class TestSharedCatalogueRepository:
+    def test_catalogue_columns(self, in_memory_repo):
+        catalogue = load_catalogue(TEST_DATA_PATH)
+        assert len(catalogue) == 20
+        position = catalogue.find_book(30128855)
+        book = catalogue.make_book(position)
+        expected = in_memory_repo.get_book(30128855)
+        assert (book.title, book.description, book.release_year, book.num_pages, book.ebook) == \
+            (expected.title, expected.description, expected.release_year, expected.num_pages, expected.ebook)
+        assert catalogue.find_book(321) is None
 
+    def test_get_book_only_materializes_that_book(self):
+        repo = SharedCatalogueRepository(load_catalogue(TEST_DATA_PATH))
+        book = repo.get_book(30128855)
+        assert book.title == "Cruelle"
+        assert book.publisher.name == "Dargaud"
+        assert repo.get_book(30128855) is book
+        assert repo.get_book(321) is None
+        assert len(repo.get_all_books()) == 20
+        assert repo.get_book(30128855) is book
 
+    def test_matches_populated_repository(self, in_memory_repo):
+        repo = SharedCatalogueRepository(load_catalogue(TEST_DATA_PATH))
+        assert repo.get_all_books() == in_memory_repo.get_all_books()
+        assert sorted(repo.get_authors()) == sorted(in_memory_repo.get_authors())
+        assert set(repo.get_publishers()) == set(in_memory_repo.get_publishers())
+        assert repo.get_books_for_author("Naoki Urasawa") == in_memory_repo.get_books_for_author("Naoki Urasawa")
+        for book in repo.get_all_books():
+            assert book.authors == in_memory_repo.get_book(book.book_id).authors
+            assert book.publisher == in_memory_repo.get_book(book.book_id).publisher
 
+    def test_browse_pages_match_populated_repository(self, in_memory_repo):
+        repo = SharedCatalogueRepository(load_catalogue(TEST_DATA_PATH))
+        for ordering in ('title', 'year', 'author', 'publisher'):
+            keys = list(in_memory_repo.get_navigation_index(ordering))
+            assert list(repo.get_navigation_index(ordering)) == keys
+            for cursor in [None] + keys:
+                page = repo.get_browse_page(ordering, cursor)
+                expected = in_memory_repo.get_browse_page(ordering, cursor)
+                assert (page.cursor, page.previous_cursor, page.next_cursor, page.first_cursor, page.last_cursor) == \
+                    (expected.cursor, expected.previous_cursor, expected.next_cursor, expected.first_cursor,
+                     expected.last_cursor)
+                assert [book.book_id for book in page.items] == [book.book_id for book in expected.items]
+        assert repo.get_release_years() == in_memory_repo.get_release_years()
+        assert repo.get_year_facet().book_ids_by_year == in_memory_repo.get_year_facet().book_ids_by_year
+        assert repo.get_author_names_with_books() == in_memory_repo.get_author_names_with_books()
+        assert repo.get_publisher_names_with_books() == in_memory_repo.get_publisher_names_with_books()
+        assert repo.get_browse_page('author', 'No Such Author') is None
 
+    def test_browse_page_only_materializes_the_books_at_the_cursor(self):
+        repo = SharedCatalogueRepository(load_catalogue(TEST_DATA_PATH))
+        page = repo.get_browse_page('author', 'Naoki Urasawa')
+        assert repo.materialized_book_ids == {book.book_id for book in page.items}
+        assert repo.get_year_of_next_book(None, page.items[0].release_year) is not None
+        assert repo.materialized_book_ids == {book.book_id for book in page.items}
 
+    def test_every_repository_method_is_answered_from_the_catalogue_or_the_overlay(self):
+        # a MemoryRepository method the shared repository neither overrides nor lists would read an empty overlay
+        inherited = {name for name in dir(MemoryRepository) if not name.startswith('_')}
+        overridden = {name for name in inherited if name in vars(SharedCatalogueRepository)}
+        assert inherited - overridden == SharedCatalogueRepository.OVERLAY_METHODS
@@ -1,13 +1,23 @@
+import os
+import shutil
 from datetime import date, datetime
 
 import pytest
+from sqlalchemy import event
+from sqlalchemy.orm import clear_mappers, sessionmaker
 
 import library.adapters.repository as repo
 from library.adapters.database_repository import SqlAlchemyRepository
+from library.adapters.database_engine import create_database_engine
+from library import create_app
+from library.adapters import repository_populate
+from utils import get_project_root
+import manage
 from library.authentication import services
 from library.domain.model import Publisher, Author, Book, Review, User
 from library.adapters.repository import RepositoryException
 
+from library.books.services import add_review
 from library.books.services import get_books_by_publisher_dict, get_books_by_year_dict, get_authors_by_name_dict
 from library.utilities.services import get_all_books, get_publishers_by_name, get_books_by_year, get_authors_by_name, get_recommended_books
 
@@ -123,8 +133,326 @@ def test_repository_can_add_a_review(session_factory):
         if book_dictionary['book_id'] == 13340336:
             assert test_review in book_dictionary['reviews']
 
+def test_repository_can_retrieve_reviews_for_book(session_factory):
+    repo = SqlAlchemyRepository(session_factory)
+    reviews = repo.get_reviews_for_book(13340336)
+
+    assert [review.review_text for review in reviews] == ['This is a great book!', 'This book was OK']
+    assert repo.get_number_of_reviews(13340336) == 2
+    assert repo.get_average_rating(13340336) == repo.get_book(13340336).average_rating
+    assert repo.get_reviews_for_book(30128855) == []
+    assert repo.get_average_rating(1) is None
+
 def test_repository_can_retrieve_reviews(session_factory):
     repo = SqlAlchemyRepository(session_factory)
 
     assert len(repo.get_reviews()) == 20
 
+def test_repository_can_retrieve_books_for_publisher_and_year(session_factory):
+    repo = SqlAlchemyRepository(session_factory)
+    books = repo.get_books_for_publisher('Avatar Press')
+    assert len(books) == 4
+    assert all(book.publisher.name == 'Avatar Press' for book in books)
+
+    books = repo.get_books_for_year(2016)
+    assert len(books) == 5
+    assert books == sorted(books)
+
+def test_repository_browse_keys_and_slices_match_dictionaries(session_factory):
+    repo = SqlAlchemyRepository(session_factory)
+    books = get_all_books(repo)
+    books_by_publisher = get_books_by_publisher_dict(books, get_publishers_by_name(repo))
+    assert repo.get_publisher_names_with_books() == list(books_by_publisher)
+    books_by_author = get_authors_by_name_dict(books, get_authors_by_name(repo))
+    assert repo.get_author_names_with_books() == list(books_by_author)
+    for author_name, author_books in books_by_author.items():
+        assert set(repo.get_books_for_author(author_name)) == set(author_books)
+    assert repo.get_release_years() == list(get_books_by_year_dict(get_books_by_year(repo)))
+    assert all(book.release_year is not None for book in repo.order_books_by_year(books))
+
+def test_repository_browse_pages_walk_the_browse_keys(session_factory):
+    repo = SqlAlchemyRepository(session_factory)
+    keys = {
+        'title': list(dict.fromkeys(book.title for book in repo.order_books_by_title(None))),
+        'year': repo.get_release_years(),
+        'author': repo.get_author_names_with_books(),
+        'publisher': repo.get_publisher_names_with_books()
+    }
+    for ordering, ordering_keys in keys.items():
+        page = repo.get_browse_page(ordering)
+        assert (page.first_cursor, page.last_cursor) == (ordering_keys[0], ordering_keys[-1])
+        for position, key in enumerate(ordering_keys):
+            page = repo.get_browse_page(ordering, key)
+            assert len(page.items) > 0
+            assert page.previous_cursor == ordering_keys[position - 1]
+            assert page.next_cursor == ordering_keys[(position + 1) % len(ordering_keys)]
+    assert repo.get_browse_page('year', 2016).items == repo.get_books_for_year(2016)
+    assert repo.get_browse_page('author', "No Such Author") is None
+
+def test_browse_page_reads_its_neighbours_in_one_statement(session_factory):
+    repo = SqlAlchemyRepository(session_factory)
+    # the publisher's books, then the four neighbouring keys together - on every page, nothing is cached
+    assert count_statements(session_factory, lambda: repo.get_browse_page('publisher', "Dargaud")) == 2
+    assert count_statements(session_factory, lambda: repo.get_browse_page('publisher', "Dargaud")) == 2
+    assert count_statements(session_factory, lambda: repo.get_year_of_next_book(None, 2016)) == 1
+
+def test_browse_pages_follow_writes_from_other_connections(session_factory):
+    repo = SqlAlchemyRepository(session_factory)
+    first_page = repo.get_browse_page('title')
+    next_page = repo.get_browse_page('title', first_page.next_cursor)
+    assert next_page.previous_cursor == first_page.cursor
+
+    # e.g. manage.py database --sync run against the database this repository has open
+    database_engine = session_factory.kw['bind']
+    book_id = first_page.items[-1].book_id
+    for table in ('reviews', 'book_authors', 'user_reading_lists', 'books'):
+        database_engine.execute(f'DELETE FROM {table} WHERE book_id = {book_id}')
+    database_engine.execute("INSERT INTO books (book_id, title, release_year) VALUES (1, '0 New Book', 1066)")
+
+    assert repo.get_browse_page('title', first_page.cursor) is None
+    assert repo.get_browse_page('title').cursor == '0 New Book'
+    assert repo.get_browse_page('title', next_page.cursor).previous_cursor == '0 New Book'
+    assert repo.get_browse_page('year').last_cursor == 1066
+
+def test_year_pages_follow_writes_from_other_connections(session_factory):
+    repo = SqlAlchemyRepository(session_factory)
+    # the year's books, then its neighbours in one keyset query, no year dictionary or facet is built
+    assert count_statements(session_factory, lambda: repo.get_browse_page('year', 2016)) == 2
+    release_years = repo.get_release_years()
+    assert release_years == sorted(release_years, reverse=True)
+
+    oldest_year = release_years[-1]
+    database_engine = session_factory.kw['bind']
+    database_engine.execute(f'UPDATE books SET release_year = NULL WHERE release_year = {oldest_year}')
+    database_engine.execute("INSERT INTO books (book_id, title, release_year) VALUES (1, 'Domesday Book', 1066)")
+    assert repo.get_browse_page('year', oldest_year) is None
+    assert repo.get_release_years()[-1] == 1066
+    page = repo.get_browse_page('year', 1066)
+    assert [book.book_id for book in page.items] == [1]
+    assert (page.previous_cursor, page.next_cursor) == (release_years[-2], release_years[0])
+
+def test_navigation_index_is_rebuilt_after_adding_a_book(session_factory):
+    repo = SqlAlchemyRepository(session_factory)
+    assert 1066 not in repo.get_navigation_index('year')
+    book = Book(1, "Domesday Book")
+    book.release_year = 1066
+    repo.add_book(book)
+    assert repo.get_navigation_index('year').last == 1066
+    assert repo.get_browse_page('title', "Domesday Book").items == [book]
+
+def test_rating_aggregates_are_persisted(session_factory):
+    repo = SqlAlchemyRepository(session_factory)
+    book = repo.get_book(13340336)
+    assert book.rating_histogram == (0, 0, 1, 0, 1)
+    ratings_count = book.ratings_count
+    author_ratings_count = book.authors[0].ratings_count
+
+    add_review(13340336, "Great read", 4, 'fmercury', repo)
+
+    book = SqlAlchemyRepository(session_factory).get_book(13340336)
+    assert book.ratings_count == ratings_count + 1
+    assert book.rating_histogram == (0, 0, 1, 1, 1)
+    assert book.authors[0].ratings_count == author_ratings_count + 1
+
+
+def capture_statements(session_factory, action):
+    statements = []
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+    engine = session_factory.kw['bind']
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        action()
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+    return statements
+
+def count_statements(session_factory, action):
+    return len(capture_statements(session_factory, action))
+
+def test_load_profile_loads_relationships_in_constant_queries(session_factory):
+    def browse_all_books(load_profile):
+        repo = SqlAlchemyRepository(session_factory)
+        for book in repo.get_all_books(load_profile):
+            [author.full_name for author in book.authors]
+            book.publisher.name
+            [review.user.user_name for review in book.reviews]
+
+    assert count_statements(session_factory, lambda: browse_all_books(None)) > 20
+    assert count_statements(session_factory, lambda: browse_all_books('browse')) <= 4
+
+def test_load_profile_for_reading_list(session_factory):
+    repo = SqlAlchemyRepository(session_factory)
+    user = repo.get_user('fmercury')
+    repo.add_to_reading_list(user, repo.get_book(13340336))
+
+    def reading_list():
+        user = SqlAlchemyRepository(session_factory).get_user('fmercury', load_profile='reading_list')
+        assert [author.full_name for book in user.read_books for author in book.authors] != []
+
+    assert count_statements(session_factory, reading_list) <= 3
+
+@pytest.mark.parametrize(('repository_query', 'expected_index'), (
+    (lambda repo: repo.get_user('fmercury'), 'sqlite_autoindex_users_1'),
+    (lambda repo: repo.get_books_for_author('Naoki Urasawa'), 'ix_book_authors_author_id_book_id'),
+    (lambda repo: repo.get_books_for_author('Naoki Urasawa'), 'ix_authors_full_name'),
+    (lambda repo: repo.get_books_for_publisher('Avatar Press'), 'ix_books_publisher_id'),
+    (lambda repo: repo.get_books_for_year(2016), 'ix_books_release_year'),
+    (lambda repo: repo.get_release_years(), 'ix_books_release_year'),
+    (lambda repo: repo.order_books_by_title(None), 'ix_books_title'),
+    (lambda repo: repo.get_publisher('Avatar Press'), 'ix_publishers_name'),
+    (lambda repo: repo.get_reviews_for_book(13340336), 'ix_reviews_book_id_rating'),
+    (lambda repo: repo.get_number_of_reviews(13340336), 'ix_reviews_book_id_rating'),
+    (lambda repo: repo.get_book(13340336, load_profile='browse').authors, 'ix_book_authors_book_id_author_id'),
+    (lambda repo: repo.get_user('fmercury', load_profile='reading_list'), 'ix_user_reading_lists_user_id_book_id'),
+))
+def test_hot_queries_use_indexes(session_factory, repository_query, expected_index):
+    repo = SqlAlchemyRepository(session_factory)
+    statements = capture_statements(session_factory, lambda: repository_query(repo))
+
+    query_plans = []
+    with session_factory.kw['bind'].connect() as connection:
+        for statement, parameters in statements:
+            query_plan = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).fetchall()
+            query_plans.append(' | '.join(row[-1] for row in query_plan))
+    assert any(expected_index in query_plan for query_plan in query_plans), query_plans
+
+def test_database_engine_pool_and_pragmas(tmp_path):
+    database_engine = create_database_engine(f"sqlite:///{tmp_path / 'pragmas.db'}", pool='queue', pool_size=2, sqlite_pragmas={
+        'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'cache_size': -20000, 'temp_store': 'MEMORY', 'mmap_size': ''})
+    assert database_engine.pool.size() == 2
+    with database_engine.connect() as connection:
+        assert connection.exec_driver_sql('PRAGMA journal_mode').scalar() == 'wal'
+        assert connection.exec_driver_sql('PRAGMA synchronous').scalar() == 1
+        assert connection.exec_driver_sql('PRAGMA cache_size').scalar() == -20000
+        assert connection.exec_driver_sql('PRAGMA temp_store').scalar() == 2
+        assert connection.exec_driver_sql('PRAGMA mmap_size').scalar() == 0
+    # the pooled connection is handed out again instead of reconnecting
+    with database_engine.connect() as connection:
+        assert database_engine.pool.checkedout() == 1
+    assert database_engine.pool.checkedin() == 1
+
+def test_forked_worker_opens_its_own_pooled_connections(tmp_path, monkeypatch):
+    database_engine = create_database_engine(f"sqlite:///{tmp_path / 'forked.db'}", pool='queue', pool_size=2)
+    connection = database_engine.raw_connection()
+    parent_connection = connection.connection
+    connection.close()
+    # the same pool, seen from a process forked after the parent used it
+    parent_pid = os.getpid()
+    monkeypatch.setattr(os, 'getpid', lambda: parent_pid + 1)
+    connection = database_engine.raw_connection()
+    assert connection.connection is not parent_connection
+    assert connection.cursor().execute('SELECT 1').fetchone() == (1,)
+    connection.close()
+    # the parent's connection was left open for the parent
+    assert parent_connection.execute('SELECT 1').fetchone() == (1,)
+
+def test_session_is_opened_lazily_and_closed_only_when_open(session_factory):
+    repo = SqlAlchemyRepository(session_factory)
+    assert not repo._session_cm.session_is_open
+    repo.close_session()
+    assert not repo._session_cm.session_is_open
+
+    book = repo.get_book(13340336)
+    assert repo._session_cm.session_is_open
+    assert repo.get_book(13340336) is book
+
+    repo.close_session()
+    assert not repo._session_cm.session_is_open
+    assert repo.get_book(13340336) is not book
+
+def copy_library_database(path):
+    # the committed library.db predates the current schema, migrated like a deployed one would be
+    shutil.copy(str(get_project_root() / 'library.db'), path)
+    manage.main(['migrate', '--database-uri', f"sqlite:///{path}"])
+
+def test_browse_all_is_not_found_for_a_title_deleted_by_another_process(tmp_path):
+    copy_library_database(str(tmp_path / 'library.db'))
+    clear_mappers()
+    database_uri = f"sqlite:///{tmp_path / 'library.db'}"
+    app = create_app({
+        'REPOSITORY': 'database',
+        'SQLALCHEMY_DATABASE_URI': database_uri,
+        'TEST_DATA_PATH': get_project_root() / 'library' / 'adapters' / 'data',
+        'POPULATE_ON_STARTUP': False
+    })
+    client = app.test_client()
+    assert client.get('/browse_all').status_code == 200
+
+    other_process = create_database_engine(database_uri)
+    book_id, title = other_process.execute('SELECT book_id, title FROM books ORDER BY title LIMIT 1').one()
+    for table in ('reviews', 'book_authors', 'user_reading_lists', 'books'):
+        other_process.execute(f'DELETE FROM {table} WHERE book_id = {book_id}')
+    assert client.get('/browse_all', query_string={'title': title}).status_code == 404
+    assert client.get('/browse_all').status_code == 200
+
+def test_requests_only_open_a_session_when_they_use_the_repository(tmp_path):
+    copy_library_database(str(tmp_path / 'library.db'))
+    clear_mappers()
+    app = create_app({
+        'REPOSITORY': 'database',
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'library.db'}",
+        'TEST_DATA_PATH': get_project_root() / 'library' / 'adapters' / 'data',
+        'DATABASE_POPULATE_MODE': 'rebuild'
+    })
+    sessions_open_at_teardown = []
+    close_session = repo.repo_instance.close_session
+    def recording_close_session():
+        sessions_open_at_teardown.append(repo.repo_instance._session_cm.session_is_open)
+        close_session()
+    repo.repo_instance.close_session = recording_close_session
+
+    client = app.test_client()
+    assert client.get('/static/css/main.css').status_code == 200
+    assert client.get('/books_by_year').status_code == 200
+    assert sessions_open_at_teardown == [False, True]
+    assert not repo.repo_instance._session_cm.session_is_open
+
+@pytest.mark.parametrize(('read_your_writes_seconds', 'books_listed_after_write'), ((0, 20), (60, 21), (-1, 21)))
+def test_listings_are_read_from_the_read_only_copy(tmp_path, read_your_writes_seconds, books_listed_after_write):
+    primary_engine = create_database_engine(f"sqlite:///{tmp_path / 'primary.db'}")
+    repository_populate.prepare_database(primary_engine, empty_tables=True)
+    repository_populate.populate(get_project_root() / "tests" / "data",
+                                 SqlAlchemyRepository(sessionmaker(bind=primary_engine)), True)
+    shutil.copy(str(tmp_path / 'primary.db'), str(tmp_path / 'replica.db'))
+    read_engine = create_database_engine(f"sqlite:///file:{tmp_path / 'replica.db'}?mode=ro&immutable=1&uri=true")
+
+    repo = SqlAlchemyRepository(sessionmaker(bind=primary_engine), sessionmaker(bind=read_engine), read_your_writes_seconds)
+    statements = capture_statements(sessionmaker(bind=read_engine), lambda: repo.get_all_books())
+    assert len(statements) == 1
+    assert repo.get_number_of_books() == 20
+
+    repo.add_book(Book(1, "A New Book"))
+    # targeted lookups always see the write, listings only within the read-your-writes window
+    assert repo.get_book(1).title == "A New Book"
+    assert repo.get_number_of_books() == books_listed_after_write
+
+def test_users_read_their_own_writes_on_any_worker(tmp_path):
+    copy_library_database(str(tmp_path / 'primary.db'))
+    copy_library_database(str(tmp_path / 'replica.db'))
+    primary_uri = f"sqlite:///{tmp_path / 'primary.db'}"
+    replica_uri = f"sqlite:///file:{tmp_path / 'replica.db'}?mode=ro&immutable=1&uri=true"
+    clear_mappers()
+    app = create_app({
+        'REPOSITORY': 'database',
+        'SQLALCHEMY_DATABASE_URI': primary_uri,
+        'SQLALCHEMY_READ_DATABASE_URI': replica_uri,
+        'READ_YOUR_WRITES_SECONDS': 60,
+        'TEST_DATA_PATH': get_project_root() / 'library' / 'adapters' / 'data',
+        'POPULATE_ON_STARTUP': False,
+        'WTF_CSRF_ENABLED': False
+    })
+    title = repo.repo_instance.get_book(13340336).title
+    review_page = {'title': title, 'view_reviews': 13340336}
+
+    writer = app.test_client()
+    writer.post('/authentication/register', data={'user_name': 'gmichael', 'password': 'CarelessWhisper1984'})
+    writer.post('/authentication/login', data={'user_name': 'gmichael', 'password': 'CarelessWhisper1984'})
+    writer.post('/review', data={'review': 'Read from the primary', 'rating': 5, 'book_id': 13340336})
+
+    # the next requests are served by another worker, which never saw the write
+    repo.repo_instance = SqlAlchemyRepository(sessionmaker(bind=create_database_engine(primary_uri)),
+                                              sessionmaker(bind=create_database_engine(replica_uri)), 60)
+    assert b'Read from the primary' in writer.get('/browse_all', query_string=review_page).data
+    # everybody else keeps reading the read-only copy
+    assert b'Read from the primary' not in app.test_client().get('/browse_all', query_string=review_page).data
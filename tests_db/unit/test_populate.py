@@ -1,6 +1,18 @@
-from sqlalchemy import select, inspect
+import json
+import sqlite3
+import shutil
+import pytest
 
+from sqlalchemy import select, inspect, create_engine
+from sqlalchemy.orm import sessionmaker
+
+from library import create_app
+from library.domain.model import Author
 from library.adapters.orm import metadata
+from library.adapters import database_repository, repository_populate, data_importer
+
+from utils import get_project_root
+import manage
 
 # all failing because UNIQUE constraint failed: authors.author_id
 def test_database_populate_inspect_table_names(database_engine):
@@ -48,4 +60,151 @@ def test_database_populate_select_all_books(database_engine):
 
         assert all_books[0] == (707611, 'Superman Archives, Vol. 2')
 
-
+def test_database_populate_in_small_batches(empty_session):
+    session_factory = sessionmaker(bind=empty_session.bind)
+    repo = database_repository.SqlAlchemyRepository(session_factory)
+    repository_populate.populate(get_project_root() / "tests" / "data", repo, True, batch_size=3)
+
+    with empty_session.bind.connect() as connection:
+        assert connection.execute('SELECT COUNT(*) FROM books').scalar() == 20
+        assert connection.execute('SELECT COUNT(*) FROM users').scalar() == 3
+        assert connection.execute('SELECT COUNT(*) FROM book_authors').scalar() == 35
+        rows = list(connection.execute('SELECT user_name FROM users JOIN reviews ON reviews.user_id = users.id'))
+        assert rows == [('test_user',), ('test_user',)]
+        rows = list(connection.execute('SELECT name FROM publishers JOIN books ON books.publisher_id = publishers.id WHERE book_id = 30128855'))
+        assert rows == [('Dargaud',)]
+
+def test_database_populate_links_each_author_and_publisher_once(database_engine):
+    with database_engine.connect() as connection:
+        number_of_authors = connection.execute('SELECT COUNT(*) FROM authors').scalar()
+        assert number_of_authors == connection.execute('SELECT COUNT(DISTINCT author_id) FROM book_authors').scalar()
+        number_of_publishers = connection.execute('SELECT COUNT(*) FROM publishers').scalar()
+        assert number_of_publishers == connection.execute('SELECT COUNT(DISTINCT name) FROM publishers').scalar()
+        duplicate_links = connection.execute(
+            'SELECT COUNT(*) FROM (SELECT book_id, author_id FROM book_authors GROUP BY book_id, author_id HAVING COUNT(*) > 1)').scalar()
+        assert duplicate_links == 0
+
+
+def test_database_sync_without_changes(empty_session):
+    repo = database_repository.SqlAlchemyRepository(sessionmaker(bind=empty_session.bind))
+    data_path = get_project_root() / "tests" / "data"
+    repository_populate.populate(data_path, repo, True)
+
+    summary = data_importer.sync_database(data_path, repo)
+    assert all(count == 0 for changes in summary.values() for count in changes.values())
+
+def test_database_sync_handles_more_authors_than_sqlite_allows_parameters(empty_session):
+    repo = database_repository.SqlAlchemyRepository(sessionmaker(bind=empty_session.bind))
+    data_path = get_project_root() / "tests" / "data"
+    repository_populate.populate(data_path, repo, True)
+    objects = data_importer.build_database_objects(data_path)
+    authors_without_books = [Author(author_id, f'Author {author_id}') for author_id in range(10 ** 9, 10 ** 9 + 2000)]
+    # the limit SQLite builds used to default to, builds that allow more fail the same way past their own limit
+    connection = empty_session.bind.raw_connection()
+    connection.connection.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, 999)
+    connection.close()
+
+    summary = repo.sync(batch_size=500, **dict(objects, authors=list(objects['authors']) + authors_without_books))
+    assert summary['authors'] == {'inserted': 2000, 'updated': 0, 'deleted': 0}
+    # once they are gone from the source, authors without books are deleted in batches
+    summary = repo.sync(batch_size=500, **objects)
+    assert summary['authors'] == {'inserted': 0, 'updated': 0, 'deleted': 2000}
+
+def test_database_sync_applies_inserts_updates_and_deletes(empty_session, tmp_path):
+    data_path = get_project_root() / "tests" / "data"
+    for file_name in ('book_authors_excerpt.json', 'comic_books_excerpt.json', 'users.csv', 'reviews.csv'):
+        shutil.copy(str(data_path / file_name), str(tmp_path / file_name))
+    repo = database_repository.SqlAlchemyRepository(sessionmaker(bind=empty_session.bind))
+    repository_populate.populate(tmp_path, repo, True)
+
+    # drop the last book, retitle the first and add a review for the second
+    with open(str(tmp_path / 'comic_books_excerpt.json')) as infile:
+        book_jsons = [json.loads(line) for line in infile]
+    removed_book_id = int(book_jsons[-1]['book_id'])
+    retitled_book_id = int(book_jsons[0]['book_id'])
+    reviewed_book_id = int(book_jsons[1]['book_id'])
+    book_jsons[0]['title'] = 'A New Title'
+    with open(str(tmp_path / 'comic_books_excerpt.json'), 'w') as outfile:
+        for book_json in book_jsons[:-1]:
+            outfile.write(json.dumps(book_json) + '\n')
+    with open(str(tmp_path / 'reviews.csv'), 'a') as outfile:
+        outfile.write(f'test_user,{reviewed_book_id},"Synced review",4,2021-10-01 10:00:00\n')
+
+    summary = data_importer.sync_database(tmp_path, repo)
+    assert summary['books'] == {'inserted': 0, 'updated': 1, 'deleted': 1}
+    assert summary['reviews'] == {'inserted': 1, 'deleted': 0}
+    assert summary['users'] == {'inserted': 0}
+
+    with empty_session.bind.connect() as connection:
+        assert connection.execute('SELECT COUNT(*) FROM books').scalar() == 19
+        assert connection.execute(f'SELECT COUNT(*) FROM book_authors WHERE book_id = {removed_book_id}').scalar() == 0
+        assert connection.execute(f'SELECT title FROM books WHERE book_id = {retitled_book_id}').scalar() == 'A New Title'
+        assert connection.execute('SELECT COUNT(*) FROM authors').scalar() == \
+            connection.execute('SELECT COUNT(DISTINCT author_id) FROM book_authors').scalar()
+    # the new review also counts towards the book's rating aggregate
+    assert repo.get_book(reviewed_book_id).ratings_count == int(book_jsons[1]['ratings_count']) + 1
+
+def test_prepare_database_adds_columns_missing_from_an_older_database(tmp_path):
+    database_engine = create_engine(f"sqlite:///{tmp_path / 'older.db'}")
+    # the books and authors tables as they were before the rating aggregates were added
+    database_engine.execute('''CREATE TABLE authors (author_id INTEGER NOT NULL, full_name VARCHAR(255),
+                               PRIMARY KEY (author_id))''')
+    database_engine.execute('''CREATE TABLE books (book_id INTEGER NOT NULL, title VARCHAR(255) NOT NULL,
+                               description VARCHAR(255), publisher_id INTEGER, release_year INTEGER, num_pages INTEGER,
+                               PRIMARY KEY (book_id), FOREIGN KEY(publisher_id) REFERENCES publishers (id))''')
+    database_engine.execute("INSERT INTO books (book_id, title) VALUES (1, 'Domesday Book')")
+
+    repository_populate.prepare_database(database_engine, empty_tables=False)
+    columns = {column['name'] for column in inspect(database_engine).get_columns('books')}
+    assert {'ratings_count', 'ratings_total', 'text_reviews_count', 'rating_histogram'} <= columns
+    assert database_engine.execute('SELECT ratings_count, ratings_total FROM books').fetchall() == [(0, 0)]
+
+    repo = database_repository.SqlAlchemyRepository(sessionmaker(bind=database_engine))
+    assert repo.get_book(1).ratings_count == 0
+    repository_populate.prepare_database(database_engine, empty_tables=True)
+    repository_populate.populate(get_project_root() / "tests" / "data", repo, True)
+    assert repo.get_book(30128855).ratings_count > 0
+
+def test_prepare_database_treats_a_column_added_by_another_process_as_done(tmp_path, monkeypatch):
+    database_engine = create_engine(f"sqlite:///{tmp_path / 'library.db'}")
+    repository_populate.prepare_database(database_engine, empty_tables=True)
+    # the first look at the books table predates another worker adding ratings_count, so the ALTER TABLE fails
+    stale_tables = {'books'}
+    def stale_inspect(engine):
+        inspector = inspect(engine)
+        get_columns = inspector.get_columns
+        def columns(table_name):
+            if table_name in stale_tables:
+                stale_tables.remove(table_name)
+                return [column for column in get_columns(table_name) if column['name'] != 'ratings_count']
+            return get_columns(table_name)
+        inspector.get_columns = columns
+        return inspector
+    monkeypatch.setattr(repository_populate, 'inspect', stale_inspect)
+    repository_populate.prepare_database(database_engine, empty_tables=False)
+    assert repository_populate.schema_changes(database_engine) == []
+
+def test_app_refuses_an_outdated_database_instead_of_migrating_it(tmp_path, capsys):
+    database_path = tmp_path / 'older.db'
+    database_engine = create_engine(f"sqlite:///{database_path}")
+    repository_populate.prepare_database(database_engine, empty_tables=True)
+    database_engine.execute('DROP INDEX ix_books_title')
+    assert repository_populate.schema_changes(database_engine) == ['books.ix_books_title']
+    with pytest.raises(RuntimeError, match='manage.py migrate'):
+        create_app({'TESTING': False, 'REPOSITORY': 'database', 'POPULATE_ON_STARTUP': False, 'TEST_DATA_PATH': None,
+                    'SQLALCHEMY_DATABASE_URI': f"sqlite:///{database_path}"})
+
+    manage.main(['migrate', '--database-uri', f"sqlite:///{database_path}"])
+    assert 'books.ix_books_title' in capsys.readouterr().out
+    assert repository_populate.schema_changes(database_engine) == []
+
+def test_manage_builds_database_offline(tmp_path, capsys):
+    database_uri = f"sqlite:///{tmp_path / 'library-offline.db'}"
+    manage.main(['--data-path', 'tests/data', 'database', '--database-uri', database_uri, '--batch-size', '7'])
+
+    output = capsys.readouterr().out
+    assert "books: 20 read" in output
+    assert "book_authors: 35" in output
+
+    manage.main(['--data-path', 'tests/data', 'database', '--database-uri', database_uri, '--sync'])
+    assert "books: 0 inserted, 0 updated, 0 deleted" in capsys.readouterr().out
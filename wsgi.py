@@ -1,7 +1,15 @@
 """App entry point."""
+import gc
+
 from library import create_app
 
 app = create_app()
 
+if app.config['SHARED_CATALOGUE'] and hasattr(gc, 'freeze'):
+    # When the server preloads this module (e.g. gunicorn --preload) everything built so far is shared with
+    # the forked workers. Moving it out of the garbage collector's reach stops collections in the workers
+    # from writing to (and copying) those pages.
+    gc.freeze()
+
 if __name__ == "__main__":
     app.run(host='localhost', port=5000, threaded=False)
\ No newline at end of file